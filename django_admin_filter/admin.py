@@ -1,3 +1,46 @@
 from django.contrib import admin
+from django.db.models import F
 
-# Register your models here.
+from . import settings as app_settings
+from .models import FilterQuery
+from .models import FilterQueryPlan
+
+
+@admin.register(FilterQuery)
+class FilterQueryAdmin(admin.ModelAdmin):
+    """
+    Lists filter queries with their execution statistics. Sort by p95 or mean
+    time to find slow filters.
+    """
+    list_display = [
+        'name', 'content_type', 'user', 'persistent', 'for_everyone',
+        'run_count', 'mean_time', 'p95_time', 'last_row_count', 'last_run']
+    list_filter = ['persistent', 'for_everyone', 'content_type']
+    search_fields = ['name', 'description']
+    ordering = [F('p95_time').desc(nulls_last=True)]
+    readonly_fields = [
+        'run_count', 'sample_count', 'mean_time', 'p95_time', 'last_row_count',
+        'last_run', 'last_used', 'created']
+
+    def get_list_select_related(self, request):
+        # content-types and users could live on another database
+        if app_settings.DATABASE:
+            return []
+        return super().get_list_select_related(request)
+
+
+@admin.register(FilterQueryPlan)
+class FilterQueryPlanAdmin(admin.ModelAdmin):
+    """
+    Lists the captured query plans of filter queries. Plans are read-only.
+    """
+    list_display = ['filter_query', 'created', 'vendor', 'duration', 'seq_scan', 'disk_sort']
+    list_filter = ['seq_scan', 'disk_sort', 'vendor']
+    list_select_related = ['filter_query']
+    search_fields = ['filter_query__name']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,12 @@
+from django.conf.urls import re_path
+from .async_views import AsyncCreateFilterQueryView, AsyncUpdateFilterQueryView
+from .views import SidebarEntriesView, ExportFilterQueryView
+from . import settings
+
+
+urlpatterns = [
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}$'.format(settings.URL_PATH), AsyncCreateFilterQueryView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}entries/$'.format(settings.URL_PATH), SidebarEntriesView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}(?P<pk>\d+|h[0-9a-f]+)/$'.format(settings.URL_PATH), AsyncUpdateFilterQueryView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}(?P<pk>\d+)/export/$'.format(settings.URL_PATH), ExportFilterQueryView.as_view()),
+]
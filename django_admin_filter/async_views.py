@@ -0,0 +1,229 @@
+"""
+Native async variants of the filter query views for ASGI deployments. They
+need Django 3.1 or newer. The async ORM API is used where Django provides it
+(4.1 and newer). Otherwise the same calls are run by sync_to_async.
+"""
+import django
+from functools import update_wrapper
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import PermissionDenied
+from django.contrib.contenttypes.models import ContentType
+from django.http import Http404
+from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.utils.text import format_lazy
+from django.utils.translation import gettext as _
+from django.views.generic.base import View
+from django.views.generic.edit import ModelFormMixin
+
+from .filterset import AdminFilterSet
+from .history import DatabaseHistory
+from .history import get_history_backend
+from .history import is_history_id
+from .models import FilterQuery
+from .replicas import pin_primary
+from .views import BaseFilterQueryView
+
+if django.VERSION < (3, 1):
+    raise ImproperlyConfigured('The async views of django_admin_filter need Django 3.1 or newer.')
+
+
+GLOBAL_PERM = 'django_admin_filter.can_handle_global_filterqueries'
+
+
+def run_async(obj, name, *args, **kwargs):
+    """
+    Call the async variant of an ORM method - e.g. aget for get - if Django
+    provides it. Otherwise run the method by sync_to_async.
+    """
+    method = getattr(obj, 'a' + name, None)
+    if method is None:
+        method = sync_to_async(getattr(obj, name))
+    return method(*args, **kwargs)
+
+
+async def load_user(request):
+    """
+    Evaluate the lazy user of the request outside the event loop.
+    """
+    if hasattr(request, 'auser'):
+        return await request.auser()
+
+    def load():
+        request.user.is_authenticated
+        return request.user
+    return await sync_to_async(load)()
+
+
+def async_setup_filterclass(func):
+    """
+    Async version of :func:`views.setup_filterclass`.
+    """
+    async def wrapper(self, request, **kwargs):
+        params = dict(app_label=kwargs['app_label'], model=kwargs['model'])
+        try:
+            self.content_type_obj = await run_async(ContentType.objects, 'get_by_natural_key', **params)
+        except ContentType.DoesNotExist:
+            msg = format_lazy(_("No model '{model}' in app '{app_label}'"), **params)
+            raise Http404(msg)
+        self.filterset_class = AdminFilterSet.by_model(self.content_type_obj.model_class())
+        return await func(self, request, **kwargs)
+    return wrapper
+
+
+def async_can_view_related_model(func):
+    """
+    Async version of :func:`views.can_view_related_model`.
+    """
+    async def wrapper(self, request, **kwargs):
+        permission = '{app_label}.view_{model}'.format(**kwargs)
+        if not await run_async(request.user, 'has_perm', permission):
+            raise PermissionDenied
+        return await func(self, request, **kwargs)
+    return wrapper
+
+
+def async_can_handle_filterquery(func):
+    """
+    Async version of :func:`views.can_handle_filterquery`. Loads the filter
+    query as self.object.
+    """
+    async def wrapper(self, request, **kwargs):
+        self.object = await self.aget_object()
+        is_owner = self.object.user_id == request.user.pk
+        can_handle = self.object.for_everyone and self.has_global_perm
+        if not is_owner and not can_handle:
+            raise PermissionDenied
+        return await func(self, request, **kwargs)
+    return wrapper
+
+
+class AsyncBaseFilterQueryView(BaseFilterQueryView, ModelFormMixin, View):
+    """
+    Base class of the async views. Blocking work that is not covered by the
+    async ORM API - like validating and rendering forms of filtersets with
+    model choices - is run by sync_to_async.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+        update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await load_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        # Permissions are cached by the user object. So the sync permission
+        # checks of the forms won't hit the database anymore.
+        self.has_global_perm = await run_async(user, 'has_perm', GLOBAL_PERM)
+        method = request.method.lower()
+        if method in self.http_method_names and hasattr(self, method):
+            return await getattr(self, method)(request, *args, **kwargs)
+        return self.http_method_not_allowed(request, *args, **kwargs)
+
+    async def aget_object(self):
+        if is_history_id(self.kwargs['pk']):
+            return await sync_to_async(self.get_object)()
+        try:
+            return await run_async(FilterQuery.objects, 'get', pk=self.kwargs['pk'])
+        except FilterQuery.DoesNotExist:
+            raise Http404(_('No filter query found matching the query'))
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data())
+
+    async def post(self, request, *args, **kwargs):
+        form = self.get_form()
+        query_form = self.get_query_form()
+
+        def is_valid():
+            return form.is_valid() and query_form.is_valid()
+        if await sync_to_async(is_valid)():
+            return await self.aform_valid(form, query_form)
+        else:
+            return self.form_invalid(form, query_form)
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    async def asave_object(self):
+        """
+        Async version of :meth:`views.BaseFilterQueryView.save_object`. Filter
+        queries and the entries of the db history backend are saved by the
+        async ORM API. Other history backends are run by sync_to_async.
+        """
+        history = get_history_backend()
+        if self.object.persistent:
+            await run_async(self.object, 'save')
+            if is_history_id(self.kwargs.get('pk')):
+                model = self.content_type_obj.model_class()
+                await sync_to_async(history.delete)(self.request, model, self.kwargs['pk'])
+        elif isinstance(history, DatabaseHistory):
+            # reuse and touch an identical history entry instead of adding one
+            duplicate = await run_async(self.object.get_history_duplicates(), 'first')
+            if duplicate:
+                await run_async(duplicate, 'save', update_fields=history.touch(duplicate, self.object))
+                self.object = duplicate
+            else:
+                await run_async(self.object, 'save')
+        else:
+            self.object = await sync_to_async(history.add)(self.request, self.object)
+
+    async def aform_valid(self, form, query_form):
+        self.prepare_object(form)
+
+        await self.asave_object()
+
+        # check extra permission for global filterqueries
+        if self.object.for_everyone and not self.has_global_perm:
+            raise PermissionDenied
+
+        await sync_to_async(pin_primary)(self.request)
+
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class AsyncCreateFilterQueryView(AsyncBaseFilterQueryView):
+    @async_setup_filterclass
+    @async_can_view_related_model
+    async def get(self, request, *args, **kwargs):
+        return await super().get(request, *args, **kwargs)
+
+    @async_setup_filterclass
+    @async_can_view_related_model
+    async def post(self, request, *args, **kwargs):
+        return await super().post(request, *args, **kwargs)
+
+
+class AsyncUpdateFilterQueryView(AsyncBaseFilterQueryView):
+    @async_setup_filterclass
+    @async_can_view_related_model
+    @async_can_handle_filterquery
+    async def get(self, request, *args, **kwargs):
+        return await super().get(request, *args, **kwargs)
+
+    @async_setup_filterclass
+    @async_can_view_related_model
+    @async_can_handle_filterquery
+    async def post(self, request, *args, **kwargs):
+        return await super().post(request, *args, **kwargs)
+
+    @async_setup_filterclass
+    @async_can_view_related_model
+    @async_can_handle_filterquery
+    async def delete(self, *args, **kwargs):
+        if is_history_id(self.kwargs['pk']):
+            history = get_history_backend()
+            model = self.content_type_obj.model_class()
+            await sync_to_async(history.delete)(self.request, model, self.kwargs['pk'])
+            response = dict(id=self.kwargs['pk'])
+        else:
+            response = dict(id=self.object.id)
+            await run_async(self.object, 'delete')
+        await sync_to_async(pin_primary)(self.request)
+        return JsonResponse(response)
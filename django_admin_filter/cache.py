@@ -0,0 +1,159 @@
+import time
+import threading
+from collections import OrderedDict
+from django.core.cache import caches
+from django.db.models.signals import post_save
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from . import settings as app_settings
+from .filterset import AdminFilterSet
+from .filterset import get_filterset_path
+
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A bounded and thread-safe in-process cache that evicts the least recently
+    used entries. With a timeout entries expire after this number of seconds.
+    """
+    def __init__(self, maxsize, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            expires, value = self._data[key]
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """
+    An in-process LRUCache in front of the django cache configured by the
+    ADMIN_FILTER_CACHE setting. Without this setting only the LRUCache is used.
+    """
+    def __init__(self, prefix, maxsize, timeout=None):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = LRUCache(maxsize, timeout)
+
+    @property
+    def backend(self):
+        if app_settings.CACHE:
+            return caches[app_settings.CACHE]
+
+    def make_key(self, key):
+        return 'django_admin_filter:{}:{}'.format(self.prefix, key)
+
+    def get(self, key, default=None):
+        value = self.local.get(key, MISSING)
+        if value is MISSING and self.backend:
+            value = self.backend.get(self.make_key(key), MISSING)
+            if value is not MISSING:
+                self.local.set(key, value)
+        return default if value is MISSING else value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.backend:
+            timeout = self.timeout or app_settings.CACHE_TIMEOUT
+            self.backend.set(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.backend:
+            self.backend.delete(self.make_key(key))
+
+    def clear(self):
+        self.local.clear()
+
+
+_versions = dict()
+
+
+def get_version(namespace):
+    """
+    Return the current version of a namespace of cache entries. Versions are
+    kept in the cache defined by ADMIN_FILTER_CACHE to share them between
+    processes. Without this setting they are kept in process memory.
+    """
+    key = 'django_admin_filter:version:{}'.format(namespace)
+    if app_settings.CACHE:
+        backend = caches[app_settings.CACHE]
+        version = backend.get(key)
+        if version is None:
+            # A time-based initial version avoids to reuse outdated entries
+            # if the version itself got evicted.
+            version = int(time.time() * 1000)
+            backend.add(key, version, None)
+            version = backend.get(key, version)
+        return version
+    else:
+        return _versions.setdefault(key, int(time.time() * 1000))
+
+
+def bump_version(namespace):
+    """
+    Invalidate all cache entries of a namespace.
+    """
+    key = 'django_admin_filter:version:{}'.format(namespace)
+    if app_settings.CACHE:
+        backend = caches[app_settings.CACHE]
+        try:
+            backend.incr(key)
+        except ValueError:
+            backend.set(key, int(time.time() * 1000), None)
+    else:
+        _versions[key] = max(_versions.get(key, 0) + 1, int(time.time() * 1000))
+
+
+def model_namespace(model):
+    return 'model:{}'.format(model._meta.label_lower)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_model_caches(sender, **kwargs):
+    """
+    Invalidate cached results and counts of a filtered model on changes. The
+    filterset of the model might not be imported yet.
+    """
+    if app_settings.RESULT_CACHE or app_settings.COUNT_CACHE_TIMEOUT:
+        if sender in AdminFilterSet._REGISTRY or get_filterset_path(sender) is not None:
+            bump_version(model_namespace(sender))
+
+
+plan_cache = TieredCache('plan', app_settings.PLAN_CACHE_SIZE)
+sidebar_cache = TieredCache('sidebar', app_settings.SIDEBAR_CACHE_SIZE)
+usage_cache = LRUCache(app_settings.PLAN_CACHE_SIZE)
+count_cache = TieredCache('count', app_settings.COUNT_CACHE_SIZE, app_settings.COUNT_CACHE_TIMEOUT)
+facet_cache = TieredCache('facet', app_settings.FACET_CACHE_SIZE, app_settings.FACET_CACHE_TIMEOUT)
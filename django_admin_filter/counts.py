@@ -0,0 +1,90 @@
+import json
+import hashlib
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from . import settings as app_settings
+from .cache import count_cache
+from .cache import get_version
+from .cache import model_namespace
+
+
+class EstimatedCount(int):
+    """
+    A row count estimated by the database.
+    """
+    estimated = True
+
+
+def estimate_postgresql(cursor, sql, params):
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def estimate_mysql(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [c[0] for c in cursor.description]
+    estimate = 1
+    for row in cursor.fetchall():
+        row = dict(zip(columns, row))
+        estimate *= (row['rows'] or 0) * (row.get('filtered') or 100) / 100
+    return estimate
+
+
+# estimators by database vendor
+ESTIMATORS = dict(
+    postgresql=estimate_postgresql,
+    mysql=estimate_mysql,
+)
+
+
+def estimate_count(queryset):
+    """
+    Return the number of rows of a queryset as estimated by the query planner
+    of the database. Returns None for databases without estimator.
+    """
+    connection = connections[queryset.db]
+    estimator = ESTIMATORS.get(connection.vendor)
+    if not estimator:
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        return int(estimator(cursor, sql, params))
+
+
+def count_queryset(queryset):
+    """
+    Count the rows of a queryset. Above the ADMIN_FILTER_ESTIMATE_COUNT_THRESHOLD
+    the estimate of the database is used instead of an exact count. Counts are
+    cached per query and version of the model's table if the
+    ADMIN_FILTER_COUNT_CACHE_TIMEOUT setting is given. Like the sidebar the
+    counts are only cached with a shared cache, which all processes invalidate.
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    if app_settings.COUNT_CACHE_TIMEOUT and app_settings.CACHE:
+        version = get_version(model_namespace(queryset.model))
+        query = '{}:{}:{}:{}'.format(queryset.db, sql, params, version)
+        key = hashlib.sha1(query.encode('utf-8')).hexdigest()
+        count = count_cache.get(key)
+        if count is None:
+            count = get_count(queryset)
+            count_cache.set(key, count)
+        return count
+    else:
+        return get_count(queryset)
+
+
+def get_count(queryset):
+    threshold = app_settings.ESTIMATE_COUNT_THRESHOLD
+    if threshold is not None:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate > threshold:
+            return EstimatedCount(estimate)
+    return queryset.count()
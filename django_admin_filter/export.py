@@ -0,0 +1,53 @@
+import csv
+from django.contrib.contenttypes.models import ContentType
+
+from . import settings as app_settings
+from .filters import compile_filter_query
+from .filterset import AdminFilterSet
+
+
+class Echo:
+    """
+    A file-like object returning what is written to it. This way the csv
+    writer yields the rows one by one instead of buffering them.
+    """
+    def write(self, value):
+        return value
+
+
+def export_fields(model):
+    """
+    The names of the concrete fields of a model. Foreign keys are exported by
+    their raw value to avoid joins.
+    """
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def filter_query_queryset(query, using=None, queryset=None):
+    """
+    Return the queryset of all items matched by a filter query. Pass using to
+    read them from another database and the queryset of a ModelAdmin to match
+    only the items it covers. Defaults to all items of the model.
+    """
+    # the content-type could live on another database than the filter query
+    model = ContentType.objects.get_for_id(query.content_type_id).model_class()
+    filterset_class = AdminFilterSet.by_model(model)
+    if queryset is None:
+        queryset = model._default_manager.all()
+    queryset = queryset.using(using) if using else queryset
+    queryset = queryset.order_by(model._meta.pk.name)
+    return compile_filter_query(query, queryset, filterset_class)
+
+
+def iter_csv(queryset, fields=None, chunk_size=None):
+    """
+    Yield the items of a queryset as csv lines starting with a header. The
+    rows are fetched in chunks by a server-side cursor where the database
+    supports it, so memory usage does not grow with the number of rows.
+    """
+    fields = fields or export_fields(queryset.model)
+    chunk_size = chunk_size or app_settings.EXPORT_CHUNK_SIZE
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
@@ -0,0 +1,120 @@
+import hashlib
+import time
+from django.core.exceptions import EmptyResultSet
+from django.db import router
+from django.db.models import Count
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django_filters.constants import EMPTY_VALUES
+from django_filters.filters import Filter
+
+from . import settings as app_settings
+from .cache import facet_cache
+from .cache import plan_cache
+from .filters import compile_filter_query
+from .filters import filterset_label
+from .filters import get_content_type
+from .models import FilterQuery
+
+
+def get_plans(entries, filterset_class):
+    """
+    Return the plans of filter queries by id. Plans missing in the plan cache
+    are built from the querydicts, which are fetched by a single query from
+    the database written to. The plan is None for filtersets that can't be
+    planned.
+    """
+    label = filterset_label(filterset_class)
+    plans, missing = dict(), list()
+    for entry in entries:
+        cached = plan_cache.get(entry.id)
+        if cached and cached[0] == (entry.querydict_hash, label):
+            plans[entry.id] = cached[1]
+        else:
+            missing.append(entry.id)
+
+    manager = FilterQuery.objects.db_manager(router.db_for_write(FilterQuery))
+    querydicts = manager.filter(pk__in=missing).values_list('pk', 'querydict_hash', 'querydict')
+    for pk, querydict_hash, querydict in querydicts:
+        filterset = filterset_class(querydict, filterset_class._meta.model._default_manager.none())
+        plans[pk] = filterset.plan
+        if plans[pk] is not None:
+            plan_cache.set(pk, ((querydict_hash, label), plans[pk]))
+    return plans
+
+
+def get_condition(filterset_class, plan):
+    """
+    Compile a plan into a Q object. Also returns whether the condition spans
+    relations. The condition is None if a filter of the plan customizes the
+    filtering, since it is unknown then.
+    """
+    condition, joins = Q(), False
+    for name, value in plan:
+        filter = filterset_class.base_filters[name]
+        if value in EMPTY_VALUES:
+            continue
+        if type(filter).filter is not Filter.filter or filter.method or filter.distinct:
+            return None, False
+        q = Q(**{'{}__{}'.format(filter.field_name, filter.lookup_expr): value})
+        condition &= ~q if filter.exclude else q
+        joins = joins or LOOKUP_SEP in filter.field_name
+    return condition, joins
+
+
+def facet_expressions(entries, filterset_class, queryset, pk_attname='pk'):
+    """
+    Return an aggregate expression for each filter query counting the rows
+    of the queryset it matches. Filters on related fields are counted
+    distinct, since their joins could multiply the rows.
+    """
+    plans = get_plans(entries, filterset_class)
+    expressions = dict()
+    for entry in entries:
+        plan = plans.get(entry.id)
+        condition, joins = (None, False) if plan is None else get_condition(filterset_class, plan)
+        if condition is None:
+            # fallback to a subquery
+            subquery = compile_filter_query(
+                entry, queryset.model._default_manager.db_manager(queryset.db).all(), filterset_class)
+            condition = Q(pk__in=subquery.values('pk'))
+        key = '{}__c'.format(entry.id)
+        if condition:
+            expressions[key] = Count(pk_attname, filter=condition, distinct=joins)
+        else:
+            expressions[key] = Count(pk_attname)
+    return expressions
+
+
+def count_facets(entries, queryset, filterset_class):
+    """
+    Return the number of rows of a queryset each filter query matches by id
+    using a single aggregate query. Pass the root queryset of the changelist,
+    so that the counts respect ModelAdmin.get_queryset. The counts are cached
+    per query for ADMIN_FILTER_FACET_CACHE_TIMEOUT seconds.
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return dict((e.id, 0) for e in entries)
+    # The query covers whatever restricts the queryset, e.g. the user.
+    query = '{}:{}:{}:{}'.format(get_content_type(queryset.model).id, queryset.db, sql, params)
+    key = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    cached = facet_cache.get(key) or dict()
+    now = time.time()
+    counts, missing = dict(), list()
+    for entry in entries:
+        count, created = cached.get((entry.id, entry.querydict_hash), (None, 0))
+        if created + app_settings.FACET_CACHE_TIMEOUT > now:
+            counts[entry.id] = count
+        else:
+            missing.append(entry)
+
+    if missing:
+        result = queryset.order_by().aggregate(**facet_expressions(missing, filterset_class, queryset))
+        for entry in missing:
+            counts[entry.id] = result['{}__c'.format(entry.id)]
+        cached = dict((k, v) for k, v in cached.items() if v[1] + app_settings.FACET_CACHE_TIMEOUT > now)
+        cached.update(((e.id, e.querydict_hash), (counts[e.id], now)) for e in missing)
+        facet_cache.set(key, cached)
+    return counts
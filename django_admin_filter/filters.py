@@ -1,11 +1,212 @@
 import re
+import json
+import time
+import base64
+import binascii
+import hashlib
+from functools import partial
 from django.utils.translation import gettext as _
+from django.utils.translation import get_language
 from django.conf import settings
 from django.contrib import admin
+from django.db import connections
+from django.db import router
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 from . import settings as app_settings
+from .cache import plan_cache
+from .cache import sidebar_cache
+from .cache import get_version
 from .filterset import AdminFilterSet
+from .history import get_history_backend
+from .history import is_history_id
 from .models import FilterQuery
+from .models import FilterQueryEntry
+from .models import get_content_type
+from .models import touch_filter_query
+from .paginator import CURSOR_VAR
+from .results import get_pk_ranges
+from .results import supports_result_cache
+from .plans import capture_slow_plan
+from .replicas import get_filter_query_database
+from .replicas import get_read_database
+from .stats import QueryTimer
+from .stats import stats_buffer
+
+
+def apply_filter_query(query, queryset, filterset_class):
+    """
+    Filter the queryset by a FilterQuery or FilterQueryEntry. If the result
+    cache is enabled the primary keys matched by persistent filter queries are
+    cached and the queryset is filtered by them. Like the sidebar the results
+    are only cached with a shared cache, which all processes invalidate.
+    """
+    model = queryset.model
+    if app_settings.RESULT_CACHE and app_settings.CACHE and query.persistent and supports_result_cache(model):
+        key = '{}:{}:{}'.format(query.id, query.querydict_hash, filterset_label(filterset_class))
+        def build_queryset():
+            return compile_filter_query(query, model._default_manager.all(), filterset_class)
+        ranges = get_pk_ranges(key, model, build_queryset)
+        if ranges is not None:
+            return queryset.filter(ranges.as_q())
+    return compile_filter_query(query, queryset, filterset_class)
+
+
+def filterset_label(filterset_class):
+    return '{}.{}'.format(filterset_class.__module__, filterset_class.__qualname__)
+
+
+def compile_filter_query(query, queryset, filterset_class):
+    """
+    Filter the queryset by the filterset of a filter query. The validated
+    plan of the filterset is cached per filter-query, querydict-version and
+    filterset-class. On a cache miss the filterset is built and validated as
+    usual.
+    """
+    version = (query.querydict_hash, filterset_label(filterset_class))
+    cached = plan_cache.get(query.id)
+    if cached and cached[0] == version:
+        return filterset_class.apply_plan(cached[1], queryset)
+
+    # Sidebar entries of the database come without querydict. It is read from
+    # the database written to, since a lagging replica could return an
+    # outdated one.
+    if getattr(query, 'querydict', None) is None:
+        query = FilterQuery.objects.db_manager(router.db_for_write(FilterQuery)).get(pk=query.id)
+    filterset = filterset_class(query.querydict, queryset)
+    plan = filterset.plan
+    if plan is not None:
+        plan_cache.set(query.id, (version, plan))
+    return filterset.qs
+
+
+class SidebarEntries(list):
+    """
+    A list of sidebar entries. If there are more persistent entries than
+    rendered, cursor points to the next ones.
+    """
+    cursor = None
+
+
+def encode_cursor(entry):
+    data = json.dumps([entry.for_everyone, entry.created.isoformat(), entry.id])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Return for_everyone, created and id of the entry encoded by a cursor.
+    Raises ValueError for invalid cursors.
+    """
+    try:
+        for_everyone, created, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        created = parse_datetime(created)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    if created is None or not isinstance(pk, int):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    return bool(for_everyone), created, pk
+
+
+def get_sidebar_entries(user, model, using=None):
+    """
+    Return the global, personal and recent filter queries of a user for a
+    model as FilterQueryEntry items. If a cache is configured by
+    ADMIN_FILTER_CACHE the entries are cached per user and content-type until a
+    filter query of this content-type changes. Entries read from an explicit
+    database bypass the cache and renew it.
+    """
+    if app_settings.CACHE:
+        content_type = get_content_type(model)
+        version = get_version('sidebar:{}'.format(content_type.id))
+        key = '{}:{}:{}:{}:{}:{}'.format(
+            content_type.id, user.pk, app_settings.HISTORY_LIMIT, app_settings.SIDEBAR_LIMIT,
+            app_settings.HISTORY_BACKEND, version)
+        entries = None if using else sidebar_cache.get(key)
+        if entries is None:
+            entries = query_sidebar_entries(user, model, using)
+            sidebar_cache.set(key, entries)
+        return entries
+    else:
+        return query_sidebar_entries(user, model, using)
+
+
+def sidebar_queryset(user, model, persistent=None, using=None):
+    """
+    Return the query used to fetch the sidebar entries as values_list. Pass
+    persistent to get only the persistent or history entries. History entries
+    are only included if stored in the database.
+    """
+    # Each branch gets the content-type condition on its own, so that each
+    # one could be looked up by an index.
+    content_type = Q(content_type_id=get_content_type(model).id)
+    branches = list()
+    if persistent is not False:
+        branches.append(Q(persistent=True, for_everyone=True))
+        branches.append(Q(persistent=True, for_everyone=False, user=user))
+    if persistent is not True and app_settings.HISTORY_LIMIT and get_history_backend().in_sidebar_query:
+        branches.append(Q(persistent=False, user=user))
+    if not branches:
+        return FilterQuery.objects.db_manager(using).none().values_list(*FilterQueryEntry._fields)
+    condition = Q()
+    for branch in branches:
+        condition |= content_type & branch
+    queryset = FilterQuery.objects.db_manager(using).filter(condition)
+    queryset = queryset.order_by('-persistent', '-for_everyone', '-created', '-id')
+    return queryset.values_list(*FilterQueryEntry._fields)
+
+
+def query_sidebar_entries(user, model, using=None):
+    entries = SidebarEntries()
+    limit = app_settings.HISTORY_LIMIT
+    if app_settings.SIDEBAR_LIMIT is not None:
+        # The first persistent entries and the history by separate queries.
+        # The rest of the persistent entries is loaded on demand.
+        page = sidebar_page(user, model, limit=app_settings.SIDEBAR_LIMIT, using=using)
+        entries.extend(page)
+        entries.cursor = page.cursor
+        history = sidebar_queryset(user, model, persistent=False, using=using)[:limit]
+        entries.extend(FilterQueryEntry(*row) for row in history)
+        return entries
+
+    # Persistent entries come first. So we could stop fetching rows as soon as
+    # the history limit is reached.
+    history = 0
+    for row in sidebar_queryset(user, model, using=using).iterator():
+        entry = FilterQueryEntry(*row)
+        if not entry.persistent:
+            if history == limit:
+                break
+            history += 1
+        entries.append(entry)
+    return entries
+
+
+def sidebar_page(user, model, cursor=None, search=None, limit=None, using=None):
+    """
+    Return a page of the persistent sidebar entries as SidebarEntries. The
+    entries are paginated by keyset: the cursor of the last entry of a page
+    points to the next page. Entries could be searched by name and
+    description.
+    """
+    queryset = sidebar_queryset(user, model, persistent=True, using=using)
+    if search:
+        queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
+    if cursor:
+        for_everyone, created, pk = decode_cursor(cursor)
+        after = Q(for_everyone=for_everyone, created=created, id__lt=pk)
+        after |= Q(for_everyone=for_everyone, created__lt=created)
+        if for_everyone:
+            after |= Q(for_everyone=False)
+        queryset = queryset.filter(after)
+    if limit is None:
+        limit = app_settings.SIDEBAR_PAGE_SIZE
+    rows = [FilterQueryEntry(*row) for row in queryset[:limit + 1]]
+    entries = SidebarEntries(rows[:limit])
+    if len(rows) > limit and entries:
+        entries.cursor = encode_cursor(entries[-1])
+    return entries
 
 
 class CustomFilter(admin.SimpleListFilter):
@@ -14,55 +215,209 @@ class CustomFilter(admin.SimpleListFilter):
     parameter_name = 'filter_id'
 
     def __init__(self, request, params, model, model_admin):
+        # the cursor of the KeysetPaginator is no lookup parameter
+        params.pop(CURSOR_VAR, None)
+        # the lookups are already fetched by the constructor of the base class
+        self.request = request
+        self.model = model
+        self.using = get_filter_query_database(request)
+        self.sidebar_entries = get_sidebar_entries(request.user, model, self.using)
+        # lookup_choices will be a plain list
+        self.cursor = getattr(self.sidebar_entries, 'cursor', None)
         super().__init__(request, params, model, model_admin)
         self.csrftoken = request.META.get('CSRF_COOKIE')
         self.user = request.user
         self.filterset_class = AdminFilterSet.by_model(model)
+        self.current_query = self.get_current_query()
+        self.fragment_key = None
+        self.facet_counts = None
+        self.timer = None
+
+    def get_current_query(self):
+        """
+        Resolve the current filter query from the lookup choices. Only filter
+        queries that are not part of the sidebar will be fetched separately.
+        """
+        if self.value() is None:
+            return None
+        for entry in self.lookup_choices:
+            if str(entry.id) == self.value():
+                return entry
+        if is_history_id(self.value()):
+            return get_history_backend().get(self.request, self.model, self.value())
         try:
-            self.current_query = FilterQuery.objects.get(pk=self.value())
-        except FilterQuery.DoesNotExist:
-            self.current_query = None
+            return FilterQuery.objects.db_manager(self.using).get(pk=self.value())
+        except (FilterQuery.DoesNotExist, ValueError):
+            return None
 
     def queryset(self, request, queryset):
         if not self.current_query:
             return queryset
 
-        return self.filterset_class(self.current_query.querydict, queryset).qs
+        measure = app_settings.STATS or app_settings.SLOW_FILTER_THRESHOLD is not None
+        sample = measure and stats_buffer.sample()
+        # The filter could run on a replica. Admin actions and list_editable
+        # changes are posted and work on the same queryset, so only reads are
+        # routed to the replica.
+        if request.method in ('GET', 'HEAD'):
+            database = get_read_database(request, queryset.model, self.current_query)
+            if database:
+                queryset = queryset.using(database)
+
+        try:
+            filtered = apply_filter_query(self.current_query, queryset, self.filterset_class)
+        except FilterQuery.DoesNotExist:
+            return queryset
+
+        # history entries of other backends than the database have no stats
+        if is_history_id(self.current_query.id):
+            return filtered
+
+        # Sampled runs are timed by the queries the changelist runs on the
+        # filtered queryset. They are recorded as soon as the sidebar renders.
+        if sample and request.method in ('GET', 'HEAD'):
+            self.filtered = filtered
+            self.timer = QueryTimer(connections[filtered.db])
+            self.timer.start()
+        else:
+            self.record_run()
+        return filtered
+
+    def record_run(self, duration=None, row_count=None):
+        if app_settings.STATS:
+            stats_buffer.record(self.current_query.id, duration, row_count)
+        else:
+            touch_filter_query(self.current_query.id)
+
+    def record_timed_run(self, changelist):
+        """
+        Stop the timer of a sampled run and record the duration of the
+        changelist queries together with the count of its paginator.
+        """
+        duration = self.timer.stop()
+        self.timer = None
+        row_count = changelist.result_count
+        if getattr(row_count, 'unknown', False):
+            row_count = None
+        capture_slow_plan(self.current_query, self.filtered, duration)
+        self.record_run(duration, row_count)
 
     def has_output(self):
         return True
 
+    @property
+    def cache_alias(self):
+        return app_settings.CACHE
+
+    @property
+    def cache_timeout(self):
+        return app_settings.CACHE_TIMEOUT
+
     def lookups(self, request, model_admin):
-        model_name = model_admin.model.__name__.lower()
-        persistent_everyone = FilterQuery.objects.filter(
-            content_type__model=model_name,
-            for_everyone=True,
-            persistent=True)
-        persistent_personal = FilterQuery.objects.filter(
-            content_type__model=model_name,
-            user=request.user,
-            for_everyone=False,
-            persistent=True)
-        history = FilterQuery.objects.filter(
-            content_type__model=model_name,
-            user=request.user,
-            persistent=False)
-        recent = history[:app_settings.HISTORY_LIMIT]
-        return list(persistent_everyone) + list(persistent_personal) + list(recent)
+        entries = self.sidebar_entries
+        history = get_history_backend()
+        if not history.in_sidebar_query:
+            entries = entries + history.entries(request, model_admin.model)
+        return entries
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        """
+        Return the aggregates counting the rows matched by each saved filter.
+        This is the hook used by the facets of Django 5.0 and newer.
+        """
+        from .facets import facet_expressions
+        entries = [e for e in self.lookup_choices if e.persistent]
+        return facet_expressions(entries, self.filterset_class, filtered_qs, pk_attname)
+
+    def get_facet_count(self, changelist, entry_id):
+        """
+        Return the facet count of a saved filter. The counts of all saved
+        filters are queried on first access by a single aggregate query, so
+        they are not queried at all if the sidebar fragment is cached.
+        """
+        if self.facet_counts is None:
+            from .facets import count_facets
+            entries = [e for e in self.lookup_choices if e.persistent]
+            if getattr(changelist, 'add_facets', False):
+                # counted over the changelist filtered by the other filters
+                result = self.get_facet_queryset(changelist)
+                self.facet_counts = dict((e.id, result['{}__c'.format(e.id)]) for e in entries)
+            else:
+                # counted over the queryset of the ModelAdmin
+                queryset = changelist.root_queryset
+                database = get_read_database(self.request, changelist.model)
+                if database:
+                    queryset = queryset.using(database)
+                self.facet_counts = count_facets(entries, queryset, self.filterset_class)
+        return self.facet_counts.get(entry_id)
 
     def choices(self, changelist):
-        if self.lookup_choices:
-            remove = self.used_parameters.keys()
-            yield {
-                'selected': not self.used_parameters,
-                'query_string': changelist.get_query_string(remove=remove),
-                'display': _('All'),
-            }
+        """
+        Yield the choice to reset the filter followed by the global, personal
+        and history sections - grouped in a single pass.
+        """
+        if self.timer is not None:
+            self.record_timed_run(changelist)
+        has_global_perm = FilterQuery.has_global_perm(self.user)
+        self.fragment_key = self.get_fragment_key(changelist, has_global_perm)
+        if not self.lookup_choices:
+            return
+
+        remove = self.used_parameters.keys()
+        yield {
+            'selected': not self.used_parameters,
+            'query_string': changelist.get_query_string(remove=remove),
+            'display': _('All'),
+        }
+
+        sections = dict(
+            global_filters=dict(title=_('Global filters'), editable=has_global_perm, choices=[]),
+            personal_filters=dict(title=_('Personal filters'), editable=True, choices=[]),
+            history=dict(title=_('History'), editable=False, choices=[]),
+        )
+        result_count = getattr(changelist, 'result_count', None)
+        facets = app_settings.FACETS or getattr(changelist, 'add_facets', False)
         for query in self.lookup_choices:
-            yield {
-                'selected': self.current_query and self.current_query.id == query.id,
+            if not query.persistent:
+                section = sections['history']
+            elif query.for_everyone:
+                section = sections['global_filters']
+            else:
+                section = sections['personal_filters']
+            section['choices'].append({
+                'selected': bool(self.current_query) and self.current_query.id == query.id,
+                'result_count': result_count,
                 'query_string': changelist.get_query_string(dict(filter_id=query.id)),
-                'csrftoken': self.csrftoken,
                 'filter': query,
-                'has_global_perm': query.has_global_perm(self.user)
-            }
+                'facet_count': partial(self.get_facet_count, changelist, query.id) if facets and query.persistent else None,
+            })
+        # more persistent entries could be loaded after the last persistent section
+        if sections['personal_filters']['choices']:
+            sections['personal_filters']['cursor'] = self.cursor
+        else:
+            sections['global_filters']['cursor'] = self.cursor
+        for name in ('global_filters', 'personal_filters', 'history'):
+            if sections[name]['choices']:
+                yield dict(sections[name], section=name)
+
+    def get_fragment_key(self, changelist, has_global_perm):
+        """
+        Return the key of the cached sidebar fragment or None if no cache is
+        configured by ADMIN_FILTER_CACHE. The key changes with any filter query
+        of the content-type as well as the parameters of the changelist.
+        """
+        if not app_settings.CACHE or getattr(changelist, 'add_facets', False):
+            return None
+        content_type = get_content_type(changelist.model)
+        version = get_version('sidebar:{}'.format(content_type.id))
+        result_count = getattr(changelist, 'result_count', None)
+        key = [
+            content_type.id, self.user.pk, has_global_perm, version,
+            app_settings.HISTORY_LIMIT, get_language(), changelist.get_query_string(),
+            result_count if getattr(result_count, 'estimated', False) else None,
+            # renew the facet counts with their cache
+            int(time.time() // (app_settings.FACET_CACHE_TIMEOUT or 1)) if app_settings.FACETS else None,
+            # history entries of other backends than the database
+            [e.id for e in self.lookup_choices if is_history_id(e.id)],
+        ]
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
@@ -1,9 +1,112 @@
+import logging
+from collections import namedtuple
+from django.apps import apps
+from django.contrib.admin.sites import all_sites
 from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ValidationError
+from django.utils.module_loading import import_string
 from django_filters.filterset import FilterSetMetaclass
 from django_filters.filterset import BaseFilterSet
 
+from . import settings as app_settings
 
 
+logger = logging.getLogger(__name__)
+
+FilterMetadata = namedtuple('FilterMetadata', ['name', 'field_name', 'lookup_expr', 'parse'])
+
+
+def get_parser(name, field):
+    """
+    Return a function parsing a raw value like the form of a filterset does -
+    the widget converts it before the field cleans it. So comma-separated
+    values of in- and range-lookups are split.
+    """
+    def parse(value):
+        return field.clean(field.widget.value_from_datadict({name: value}, dict(), name))
+    return parse
+
+
+class FilterSetMetadata:
+    """
+    The parameter names of a filterset class with the lookup types and value
+    parsers of their filters. It is used to extract and validate querydicts
+    without building the form of a filterset.
+    """
+    def __init__(self, filterset_class):
+        self.filters = dict()
+        for name, filter in filterset_class.base_filters.items():
+            self.filters[name] = FilterMetadata(
+                name, filter.field_name, filter.lookup_expr, get_parser(name, filter.field))
+        self.param_names = frozenset(self.filters)
+
+    def extract_querydict(self, data):
+        """
+        Return the non-empty filter parameters of the data.
+        """
+        # TODO: Filter out FILTERS_NULL_CHOICE_VALUE for ChoiceFilter and
+        # 'unknown' for BooleanFields.
+        return dict((k, v) for k, v in data.items() if k in self.param_names and v != '')
+
+    def validate(self, querydict):
+        """
+        Parse the values of a querydict. Returns a dict of errors by parameter.
+        """
+        errors = dict()
+        for name, value in querydict.items():
+            if name not in self.filters:
+                errors[name] = ['Unknown filter parameter.']
+                continue
+            try:
+                self.filters[name].parse(value)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        return errors
+
+
+def get_filterset_path(model):
+    """
+    Return the filterset declared for a model by the ADMIN_FILTER_FILTERSETS
+    setting or the filterset_class attribute of its ModelAdmin. This is a
+    dotted path or a class.
+    """
+    for label, path in app_settings.FILTERSETS.items():
+        if label.lower() == model._meta.label_lower:
+            return path
+    for site in all_sites:
+        path = getattr(site._registry.get(model), 'filterset_class', None)
+        if path:
+            return path
+    return None
+
+
+def deferred_filtersets():
+    """
+    Return the dotted paths of the declared filtersets that were not imported
+    yet by model label.
+    """
+    deferred = dict()
+    models = [apps.get_model(label) for label in app_settings.FILTERSETS]
+    for site in all_sites:
+        models.extend(m for m, a in site._registry.items() if getattr(a, 'filterset_class', None))
+    for model in models:
+        path = get_filterset_path(model)
+        if model not in AdminFilterSet._REGISTRY and isinstance(path, str):
+            deferred[model._meta.label] = path
+    return deferred
+
+
+def report_deferred_filtersets():
+    """
+    Log the declared filtersets that were not imported yet. This is done on
+    the first lookup of a filterset, when the ModelAdmins are registered.
+    """
+    deferred = deferred_filtersets()
+    if deferred:
+        logger.info('%d filtersets are imported on first use.', len(deferred))
+    for label, path in sorted(deferred.items()):
+        logger.debug('Deferred filterset of %s: %s', label, path)
+
 
 class AdminFilterSetMetaclass(FilterSetMetaclass):
     """
@@ -18,14 +121,75 @@ class AdminFilterSetMetaclass(FilterSetMetaclass):
 
 class AdminFilterSet(BaseFilterSet, metaclass=AdminFilterSetMetaclass):
     _REGISTRY = dict()
+    _METADATA = dict()
+    _REPORTED = False
 
     @classmethod
     def by_model(cls, model):
         """
-        Return the filterset for a given model.
+        Return the filterset for a given model. Filtersets declared by dotted
+        path are imported on the first lookup.
         """
+        if not AdminFilterSet._REPORTED:
+            AdminFilterSet._REPORTED = True
+            report_deferred_filtersets()
         try:
             return cls._REGISTRY[model]
         except KeyError:
+            pass
+        path = get_filterset_path(model)
+        if path is None:
             msg = "No filterset was declared for model '{}'"
             raise ImproperlyConfigured(msg.format(model.__name__))
+        try:
+            filterset_class = import_string(path) if isinstance(path, str) else path
+        except ImportError as exc:
+            msg = "Could not import the filterset of model '{}': {}"
+            raise ImproperlyConfigured(msg.format(model.__name__, exc))
+        # An already imported module does not register its filterset again.
+        cls._REGISTRY[model] = filterset_class
+        return filterset_class
+
+    @property
+    def plan(self):
+        """
+        The validated filter values as a tuple of (name, value) pairs. This
+        plan could be applied using :meth:`apply_plan` without building and
+        validating the form again. Returns None for filtersets that customize
+        filter_queryset, since the plan would bypass their logic.
+        """
+        if type(self).filter_queryset is not BaseFilterSet.filter_queryset:
+            return None
+        self.errors
+        return tuple(self.form.cleaned_data.items())
+
+    @classmethod
+    def apply_plan(cls, plan, queryset):
+        """
+        Filter the queryset by a plan returned by :attr:`plan`.
+        """
+        filterset = cls(queryset=queryset)
+        queryset = queryset.all()
+        for name, value in plan:
+            queryset = filterset.filters[name].filter(queryset, value)
+        return queryset
+
+    @classmethod
+    def get_metadata(cls):
+        """
+        Return the FilterSetMetadata of the class. It is built once on first
+        use, since the filtersets are declared by modules imported by the
+        admin autodiscovery after the app is ready.
+        """
+        try:
+            return cls._METADATA[cls]
+        except KeyError:
+            return cls._METADATA.setdefault(cls, FilterSetMetadata(cls))
+
+    @classmethod
+    def validate_querydict(cls, querydict):
+        """
+        Validate the values of a querydict by the form fields of the declared
+        filters without building a form. Returns a dict of errors by parameter.
+        """
+        return cls.get_metadata().validate(querydict)
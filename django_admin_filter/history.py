@@ -0,0 +1,215 @@
+import json
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from . import settings as app_settings
+from .models import FilterQuery
+from .models import FilterQueryEntry
+from .models import format_stats
+from .models import get_content_type
+from .models import hash_querydict
+
+HISTORY_ID_PREFIX = 'h'
+
+
+def is_history_id(value):
+    """
+    Whether an id belongs to a history entry that is not stored as FilterQuery.
+    """
+    return isinstance(value, str) and value.startswith(HISTORY_ID_PREFIX)
+
+
+class HistoryEntry(namedtuple('HistoryEntry', FilterQueryEntry._fields + ('querydict',))):
+    """
+    A history entry of a backend other than the database. Unlike the
+    FilterQueryEntry it comes with its querydict.
+    """
+    __slots__ = ()
+
+    @property
+    def stats(self):
+        return format_stats(self)
+
+
+class DatabaseHistory:
+    """
+    Store history entries as FilterQuery rows. This is the default backend.
+    Its entries are fetched along with the persistent sidebar entries by a
+    single query. The history is bounded by the ADMIN_FILTER_HISTORY_MODE.
+    """
+    in_sidebar_query = True
+
+    def entries(self, request, model):
+        queryset = FilterQuery.objects.filter(
+            user=request.user, content_type=get_content_type(model), persistent=False)
+        queryset = queryset.order_by('-created', '-id')[:app_settings.HISTORY_LIMIT]
+        return [FilterQueryEntry(*row) for row in queryset.values_list(*FilterQueryEntry._fields)]
+
+    def add(self, request, query):
+        """
+        Save a new history entry. An identical history entry is touched and
+        returned instead of adding one.
+        """
+        duplicate = query.get_history_duplicate()
+        if not duplicate:
+            query.save()
+            return query
+        duplicate.save(update_fields=self.touch(duplicate, query))
+        return duplicate
+
+    def touch(self, duplicate, query):
+        """
+        Move a duplicate to the top by its created date and take over name and
+        description of the query. Returns the fields to update.
+        """
+        duplicate.name = query.name or duplicate.name
+        duplicate.description = query.description or duplicate.description
+        duplicate.created = timezone.now()
+        return ['name', 'description', 'created']
+
+    def get(self, request, model, pk):
+        try:
+            return FilterQuery.objects.filter(
+                pk=pk, user=request.user, content_type=get_content_type(model), persistent=False).first()
+        except ValueError:
+            return None
+
+    def delete(self, request, model, pk):
+        entry = self.get(request, model, pk)
+        if entry:
+            entry.delete()
+
+
+class KeyValueHistory:
+    """
+    Base class of backends storing the history of a user and model as list of
+    dicts. At most ADMIN_FILTER_HISTORY_LIMIT entries are kept - the oldest
+    ones are evicted. Entries older than ADMIN_FILTER_HISTORY_TTL days are
+    dropped.
+    """
+    in_sidebar_query = False
+
+    def load(self, request, model):
+        raise NotImplementedError
+
+    def store(self, request, model, items):
+        raise NotImplementedError
+
+    def get_items(self, request, model):
+        items = self.load(request, model) or list()
+        if app_settings.HISTORY_TTL:
+            expired = (timezone.now() - timedelta(days=app_settings.HISTORY_TTL)).isoformat()
+            items = [i for i in items if i['created'] > expired]
+        return items
+
+    def to_entry(self, request, item):
+        return HistoryEntry(
+            id=item['id'], name=item['name'], description=item['description'],
+            persistent=False, for_everyone=False, user_id=request.user.pk,
+            querydict_hash=item['querydict_hash'], database='', run_count=0,
+            mean_time=None, p95_time=None, last_row_count=None,
+            created=parse_datetime(item['created']), querydict=item['querydict'])
+
+    def entries(self, request, model):
+        items = self.get_items(request, model)[:app_settings.HISTORY_LIMIT]
+        return [self.to_entry(request, item) for item in items]
+
+    def add(self, request, query):
+        """
+        Add an unsaved filter query as first entry and return it as
+        HistoryEntry. An identical entry is moved to the top instead.
+        """
+        querydict_hash = hash_querydict(query.querydict)
+        items = self.get_items(request, query.content_type.model_class())
+        duplicate = next((i for i in items if i['querydict_hash'] == querydict_hash), dict())
+        query.name = query.name or duplicate.get('name')
+        query.description = query.description or duplicate.get('description')
+        query.set_defaults()
+        item = dict(
+            id=duplicate.get('id') or HISTORY_ID_PREFIX + uuid.uuid4().hex[:12],
+            name=query.name,
+            description=query.description,
+            # stored as it is loaded from the database
+            querydict=json.loads(json.dumps(query.querydict, cls=DjangoJSONEncoder)),
+            querydict_hash=querydict_hash,
+            created=timezone.now().isoformat(),
+        )
+        items = [item] + [i for i in items if i['id'] != item['id']]
+        # the applied entry is kept even without history
+        self.store(request, query.content_type.model_class(), items[:max(app_settings.HISTORY_LIMIT, 1)])
+        return self.to_entry(request, item)
+
+    def get(self, request, model, pk):
+        for item in self.get_items(request, model):
+            if item['id'] == pk:
+                return self.to_entry(request, item)
+        return None
+
+    def delete(self, request, model, pk):
+        items = self.get_items(request, model)
+        self.store(request, model, [i for i in items if i['id'] != pk])
+
+
+class CacheHistory(KeyValueHistory):
+    """
+    Store history entries in the django cache given by ADMIN_FILTER_CACHE or
+    the default cache. The entries expire after ADMIN_FILTER_HISTORY_TTL days
+    or the timeout of the cache.
+    """
+    @property
+    def cache(self):
+        return caches[app_settings.CACHE or 'default']
+
+    def make_key(self, request, model):
+        return 'django_admin_filter:history:{}:{}'.format(request.user.pk, get_content_type(model).id)
+
+    def load(self, request, model):
+        return self.cache.get(self.make_key(request, model))
+
+    def store(self, request, model, items):
+        timeout = app_settings.HISTORY_TTL * 86400 if app_settings.HISTORY_TTL else DEFAULT_TIMEOUT
+        self.cache.set(self.make_key(request, model), items, timeout)
+
+
+class SessionHistory(KeyValueHistory):
+    """
+    Store history entries in the session of the user.
+    """
+    session_key = '_admin_filter_history'
+
+    def load(self, request, model):
+        return request.session.get(self.session_key, dict()).get(str(get_content_type(model).id))
+
+    def store(self, request, model, items):
+        history = dict(request.session.get(self.session_key, dict()))
+        history[str(get_content_type(model).id)] = items
+        request.session[self.session_key] = history
+
+
+BACKENDS = dict(
+    db=DatabaseHistory,
+    cache=CacheHistory,
+    session=SessionHistory,
+)
+
+
+@lru_cache(maxsize=None)
+def load_history_backend(name):
+    backend = BACKENDS.get(name) or import_string(name)
+    return backend()
+
+
+def get_history_backend():
+    """
+    Return the backend given by ADMIN_FILTER_HISTORY_BACKEND - either one of
+    'db', 'cache' and 'session' or the dotted path of a backend class.
+    """
+    return load_history_backend(app_settings.HISTORY_BACKEND)
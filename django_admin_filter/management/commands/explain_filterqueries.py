@@ -0,0 +1,51 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ...filters import apply_filter_query
+from ...filterset import AdminFilterSet
+from ...models import FilterQuery
+from ...plans import capture_plan
+
+
+class Command(BaseCommand):
+    help = 'Capture the query plans of filter queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ids',
+            nargs='*',
+            type=int,
+            help='Ids of the filter queries to explain.')
+        parser.add_argument(
+            '-p', '--persistent',
+            action='store_true',
+            help='Explain all saved filters.')
+        parser.add_argument(
+            '-a', '--analyze',
+            action='store_true',
+            help='Execute the queries to get the actual plans (PostgreSQL and MySQL).')
+        parser.add_argument(
+            '-f', '--flagged',
+            action='store_true',
+            help='Only print plans with sequential scans or sorts on disk.')
+
+    def handle(self, *args, **options):
+        if not options['ids'] and not options['persistent']:
+            raise CommandError('Pass some filter query ids or use --persistent.')
+        queries = FilterQuery.objects.all()
+        if options['ids']:
+            queries = queries.filter(pk__in=options['ids'])
+        if options['persistent']:
+            queries = queries.filter(persistent=True)
+
+        for query in queries.order_by('pk').iterator():
+            model = ContentType.objects.get_for_id(query.content_type_id).model_class()
+            filterset_class = AdminFilterSet.by_model(model)
+            queryset = apply_filter_query(query, model._default_manager.all(), filterset_class)
+            plan = capture_plan(query, queryset, analyze=options['analyze'])
+            if options['flagged'] and not (plan.seq_scan or plan.disk_sort):
+                continue
+            flags = [f for f in ('seq_scan', 'disk_sort') if getattr(plan, f)]
+            self.stdout.write('{} ({}): {}'.format(query.name, query.id, ', '.join(flags) or 'ok'))
+            self.stdout.write(plan.plan)
@@ -0,0 +1,75 @@
+import json
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ... import settings as app_settings
+from ...models import FilterQuery
+
+
+class Command(BaseCommand):
+    help = 'Export filter queries as json lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            help='Only export filter queries of these models (app_label.model).')
+        parser.add_argument(
+            '--history',
+            action='store_true',
+            help='Export history entries as well.')
+        parser.add_argument(
+            '-o', '--output',
+            help='Write to this file instead of stdout.')
+        parser.add_argument(
+            '-c', '--chunk-size',
+            type=int,
+            default=app_settings.EXPORT_CHUNK_SIZE,
+            help='Number of rows fetched at once.')
+
+    def handle(self, *args, **options):
+        queryset = FilterQuery.objects.order_by('pk')
+        if not options['history']:
+            queryset = queryset.filter(persistent=True)
+        if options['models']:
+            queryset = queryset.filter(content_type__in=[self.get_content_type(m) for m in options['models']])
+        rows = queryset.values(
+            'name', 'description', 'querydict', 'persistent', 'for_everyone',
+            'content_type_id', 'user_id')
+        # users and content-types could live on another database
+        usernames = self.get_usernames(queryset)
+
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        try:
+            for row in rows.iterator(chunk_size=options['chunk_size']):
+                # skip filter queries of users deleted meanwhile
+                if row['user_id'] not in usernames:
+                    continue
+                line = dict(
+                    name=row['name'],
+                    description=row['description'],
+                    querydict=row['querydict'],
+                    persistent=row['persistent'],
+                    for_everyone=row['for_everyone'],
+                    content_type=list(ContentType.objects.get_for_id(row['content_type_id']).natural_key()),
+                    user=[usernames[row['user_id']]],
+                )
+                output.write(json.dumps(line, cls=DjangoJSONEncoder) + '\n')
+        finally:
+            if options['output']:
+                output.close()
+
+    def get_usernames(self, queryset):
+        User = get_user_model()
+        user_ids = list(queryset.order_by().values_list('user_id', flat=True).distinct())
+        return dict(User._default_manager.filter(pk__in=user_ids).values_list('pk', User.USERNAME_FIELD))
+
+    def get_content_type(self, label):
+        try:
+            app_label, model = label.lower().split('.')
+            return ContentType.objects.get_by_natural_key(app_label, model)
+        except (ValueError, ContentType.DoesNotExist):
+            raise CommandError('Unknown model: {}'.format(label))
@@ -0,0 +1,48 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ...export import filter_query_queryset
+from ...export import iter_csv
+from ...models import FilterQuery
+from ...replicas import get_replica
+
+
+class Command(BaseCommand):
+    help = 'Export all items matched by a filter query as csv.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'id',
+            type=int,
+            help='Id of the filter query.')
+        parser.add_argument(
+            '-f', '--fields',
+            nargs='+',
+            help='The fields to export. Defaults to all concrete fields.')
+        parser.add_argument(
+            '-o', '--output',
+            help='Write to this file instead of stdout.')
+        parser.add_argument(
+            '-c', '--chunk-size',
+            type=int,
+            help='Number of rows fetched at once.')
+        parser.add_argument(
+            '-d', '--database',
+            help='Read the items from this database. Defaults to the replica of the filter query.')
+
+    def handle(self, *args, **options):
+        try:
+            query = FilterQuery.objects.get(pk=options['id'])
+        except FilterQuery.DoesNotExist:
+            raise CommandError('No filter query with id {}.'.format(options['id']))
+
+        model = ContentType.objects.get_for_id(query.content_type_id).model_class()
+        database = options['database'] or get_replica(model, query)
+        lines = iter_csv(filter_query_queryset(query, database), options['fields'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,137 @@
+import sys
+import json
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+
+from ...cache import bump_version
+from ...filterset import AdminFilterSet
+from ...models import FilterQuery
+from ...models import hash_querydict
+
+
+class Command(BaseCommand):
+    help = 'Import filter queries from json lines as written by export_filterqueries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            nargs='?',
+            help='The file to read from. Defaults to stdin.')
+        parser.add_argument(
+            '-b', '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of filter queries created at once.')
+
+    def handle(self, *args, **options):
+        self.users = dict()
+        self.filtersets = dict()
+        self.content_types = set()
+        self.counts = dict(imported=0, skipped=0, invalid=0)
+        batch_size = options['batch_size']
+
+        input = open(options['input']) if options['input'] else sys.stdin
+        try:
+            batch = list()
+            for number, line in enumerate(input, 1):
+                if not line.strip():
+                    continue
+                query = self.build(number, line)
+                if query:
+                    batch.append(query)
+                if len(batch) == batch_size:
+                    self.create(batch)
+                    batch = list()
+            self.create(batch)
+        finally:
+            if options['input']:
+                input.close()
+
+        # bulk_create sends no signals
+        for content_type_id in self.content_types:
+            bump_version('sidebar:{}'.format(content_type_id))
+        self.stdout.write('{imported} imported, {skipped} skipped, {invalid} invalid'.format(**self.counts))
+
+    def invalid(self, number, msg):
+        self.counts['invalid'] += 1
+        self.stderr.write('line {}: {}'.format(number, msg))
+
+    def build(self, number, line):
+        """
+        Build an unsaved FilterQuery from a line. Since bulk_create bypasses
+        FilterQuery.save, the querydict_hash and the description are set here.
+        """
+        try:
+            data = json.loads(line)
+            content_type = ContentType.objects.get_by_natural_key(*data['content_type'])
+            user = self.get_user(data['user'])
+            querydict = data['querydict']
+            name = data['name']
+        except (ValueError, KeyError, TypeError) as exc:
+            return self.invalid(number, 'invalid data: {}'.format(exc))
+        except ContentType.DoesNotExist:
+            return self.invalid(number, 'unknown content-type {}'.format(data['content_type']))
+        if user is None:
+            return self.invalid(number, 'unknown user {}'.format(data['user']))
+
+        filterset_class = self.get_filterset(content_type)
+        if filterset_class is None:
+            return self.invalid(number, 'no filterset for {}'.format(data['content_type']))
+        errors = filterset_class.validate_querydict(querydict)
+        if errors:
+            return self.invalid(number, 'invalid querydict {}'.format(errors))
+
+        query = FilterQuery(
+            name=name,
+            description=data.get('description') or '',
+            querydict=querydict,
+            querydict_hash=hash_querydict(querydict),
+            persistent=data.get('persistent', True),
+            for_everyone=data.get('for_everyone', False),
+            content_type=content_type,
+            user=user)
+        if not query.description:
+            query.description = query.pretty_query
+        return query
+
+    def get_user(self, natural_key):
+        key = tuple(natural_key)
+        if key not in self.users:
+            try:
+                self.users[key] = get_user_model()._default_manager.get_by_natural_key(*key)
+            except get_user_model().DoesNotExist:
+                self.users[key] = None
+        return self.users[key]
+
+    def get_filterset(self, content_type):
+        if content_type.id not in self.filtersets:
+            try:
+                filterset_class = AdminFilterSet.by_model(content_type.model_class())
+            except ImproperlyConfigured:
+                filterset_class = None
+            self.filtersets[content_type.id] = filterset_class
+        return self.filtersets[content_type.id]
+
+    def create(self, batch):
+        """
+        Create a batch of filter queries skipping those already existing with
+        the same user, content-type, name and querydict.
+        """
+        if not batch:
+            return
+        existing = set(FilterQuery.objects.filter(
+            querydict_hash__in=set(q.querydict_hash for q in batch)
+        ).values_list('user_id', 'content_type_id', 'name', 'querydict_hash'))
+        queries = list()
+        for query in batch:
+            key = (query.user_id, query.content_type_id, query.name, query.querydict_hash)
+            if key in existing:
+                self.counts['skipped'] += 1
+                continue
+            existing.add(key)
+            queries.append(query)
+        FilterQuery.objects.bulk_create(queries, ignore_conflicts=True)
+        self.counts['imported'] += len(queries)
+        self.content_types.update(q.content_type_id for q in queries)
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ... import settings as app_settings
+from ...models import FilterQuery
+
+
+class Command(BaseCommand):
+    help = 'Purge outdated history entries and unused filter queries in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--history-ttl',
+            type=float,
+            default=app_settings.HISTORY_TTL,
+            help='Delete history entries older than this number of days.')
+        parser.add_argument(
+            '--unused-ttl',
+            type=float,
+            default=app_settings.UNUSED_FILTER_TTL,
+            help='Delete saved filters not used for this number of days.')
+        parser.add_argument(
+            '-t', '--truncate',
+            action='store_true',
+            help='Delete history entries beyond the ADMIN_FILTER_HISTORY_LIMIT.')
+        parser.add_argument(
+            '-c', '--chunk-size',
+            type=int,
+            default=app_settings.PURGE_CHUNK_SIZE,
+            help='Number of rows deleted within one transaction.')
+        parser.add_argument(
+            '-s', '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to sleep between two chunks.')
+        parser.add_argument(
+            '-n', '--dry-run',
+            action='store_true',
+            help='Only report the number of rows to be deleted.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        now = timezone.now()
+        history = FilterQuery.objects.filter(persistent=False)
+
+        if options['history_ttl'] is not None:
+            expiry = now - timedelta(days=options['history_ttl'])
+            self.purge('expired history entries', history.filter(created__lt=expiry))
+
+        if options['unused_ttl'] is not None:
+            expiry = now - timedelta(days=options['unused_ttl'])
+            # Filter queries without last_used are spared, since we don't
+            # know when they were used.
+            unused = FilterQuery.objects.filter(persistent=True, last_used__lt=expiry)
+            self.purge('unused filters', unused)
+
+        if options['truncate']:
+            limit = app_settings.HISTORY_LIMIT
+            groups = history.values('user_id', 'content_type_id')
+            groups = groups.annotate(count=Count('pk')).filter(count__gt=limit).order_by()
+            for group in list(groups):
+                entries = history.filter(
+                    user_id=group['user_id'],
+                    content_type_id=group['content_type_id']
+                ).order_by('-created', '-pk')
+                self.purge('history entries beyond the limit', entries, offset=limit)
+
+    def purge(self, label, queryset, offset=0):
+        """
+        Delete the rows of a queryset in chunks - each within its own
+        transaction. With an offset the first rows will be spared.
+        """
+        if self.options['dry_run']:
+            count = max(queryset.count() - offset, 0)
+            self.stdout.write('{}: {} rows would be deleted'.format(label, count))
+            return
+
+        chunk_size = self.options['chunk_size']
+        start = time.perf_counter()
+        count = 0
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[offset:offset + chunk_size])
+            if not pks:
+                break
+            with transaction.atomic(using=queryset.db):
+                FilterQuery.objects.filter(pk__in=pks).delete()
+            count += len(pks)
+            if len(pks) < chunk_size:
+                break
+            if self.options['sleep']:
+                time.sleep(self.options['sleep'])
+
+        duration = time.perf_counter() - start
+        self.stdout.write('{}: {} rows deleted in {:.2f}s ({:.0f} rows/s)'.format(
+            label, count, duration, count / duration if duration else 0))
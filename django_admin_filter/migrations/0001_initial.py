@@ -10,6 +10,14 @@ import django.db.models.deletion
 # * the jsonfield import was commented out
 # * the JSONField was replaced by a TextField (these fields are equivalent on
 #   the database level)
+# * on a database of their own (ADMIN_FILTER_DATABASE) content-types and users
+#   are referenced without constraint, since their tables live elsewhere
+
+
+if getattr(settings, 'ADMIN_FILTER_DATABASE', None):
+    REFERENCE_OPTIONS = dict(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING)
+else:
+    REFERENCE_OPTIONS = dict(on_delete=django.db.models.deletion.CASCADE)
 
 
 class Migration(migrations.Migration):
@@ -32,8 +40,8 @@ class Migration(migrations.Migration):
                 # ('querydict', jsonfield.fields.JSONField(default={})),
                 ('querydict', models.TextField(default='{}')),
                 ('created', models.DateTimeField(auto_now_add=True)),
-                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
-                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType', **REFERENCE_OPTIONS)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL, **REFERENCE_OPTIONS)),
             ],
             options={
                 'ordering': ['-created'],
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0005_auto_20210308_2052'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filterquery',
+            index=models.Index(fields=['content_type', 'user', 'persistent', '-created'], name='fq_personal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filterquery',
+            index=models.Index(condition=models.Q(('for_everyone', True), ('persistent', True)), fields=['content_type', 'for_everyone', 'persistent', '-created'], name='fq_global_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:15
+
+import json
+import hashlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+CHUNK_SIZE = 1000
+
+
+def hash_querydict(querydict):
+    """
+    Copy of models.hash_querydict as of this migration - the migration must
+    not change with the model code.
+    """
+    data = json.dumps(querydict, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def backfill_querydict_hash(apps, schema_editor):
+    """
+    Calculate the querydict hashes of existing filter queries in chunks.
+    """
+    FilterQuery = apps.get_model('django_admin_filter', 'FilterQuery')
+    queryset = FilterQuery.objects.using(schema_editor.connection.alias)
+    queryset = queryset.filter(querydict_hash='').only('pk', 'querydict').order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for filter_query in chunk:
+            filter_query.querydict_hash = hash_querydict(filter_query.querydict)
+        FilterQuery.objects.using(schema_editor.connection.alias).bulk_update(chunk, ['querydict_hash'])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Each chunk of the backfill is committed on its own.
+    atomic = False
+
+    dependencies = [
+        ('django_admin_filter', '0006_filterquery_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filterquery',
+            name='querydict_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill_querydict_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0007_filterquery_querydict_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filterquery',
+            name='slot',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='filterquery',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'slot'), name='fq_history_slot_uniq'),
+        ),
+    ]
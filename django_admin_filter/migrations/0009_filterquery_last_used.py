@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:16
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_last_used(apps, schema_editor):
+    """
+    Existing filter queries count as used now. Otherwise all of them would be
+    purged as unused by their created date.
+    """
+    FilterQuery = apps.get_model('django_admin_filter', 'FilterQuery')
+    queryset = FilterQuery.objects.using(schema_editor.connection.alias)
+    queryset.filter(last_used=None).update(last_used=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0008_filterquery_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filterquery',
+            name='last_used',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_last_used, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0009_filterquery_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filterquery',
+            name='last_row_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='filterquery',
+            name='last_run',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='filterquery',
+            name='mean_time',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='filterquery',
+            name='p95_time',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='filterquery',
+            name='run_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='filterquery',
+            name='sample_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
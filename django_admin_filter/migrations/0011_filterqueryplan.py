@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0010_filterquery_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilterQueryPlan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('querydict_hash', models.CharField(blank=True, max_length=40)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('vendor', models.CharField(max_length=32)),
+                ('plan', models.TextField()),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('seq_scan', models.BooleanField(default=False)),
+                ('disk_sort', models.BooleanField(default=False)),
+                ('filter_query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plans', to='django_admin_filter.filterquery')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:44
+
+from django.db import migrations, models
+import django_admin_filter.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0011_filterqueryplan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filterquery',
+            name='database',
+            field=models.CharField(blank=True, max_length=64, validators=[django_admin_filter.models.validate_database]),
+        ),
+    ]
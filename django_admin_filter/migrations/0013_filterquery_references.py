@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Only on a database of their own (ADMIN_FILTER_DATABASE) filter queries
+# reference content-types and users without constraint - as in models.py.
+if getattr(settings, 'ADMIN_FILTER_DATABASE', None):
+    REFERENCE_OPTIONS = dict(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING)
+else:
+    REFERENCE_OPTIONS = dict(on_delete=django.db.models.deletion.CASCADE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_admin_filter', '0012_filterquery_database'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filterquery',
+            name='content_type',
+            field=models.ForeignKey(to='contenttypes.contenttype', **REFERENCE_OPTIONS),
+        ),
+        migrations.AlterField(
+            model_name='filterquery',
+            name='user',
+            field=models.ForeignKey(to=settings.AUTH_USER_MODEL, **REFERENCE_OPTIONS),
+        ),
+    ]
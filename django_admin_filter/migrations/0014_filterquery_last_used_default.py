@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_admin_filter', '0013_filterquery_references'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filterquery',
+            name='last_used',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False, null=True),
+        ),
+    ]
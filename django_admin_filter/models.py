@@ -1,20 +1,59 @@
 import json
+import time
+import hashlib
+from collections import namedtuple
 from urllib.parse import urlencode
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.db import IntegrityError
+from django.db import connections
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 from django.core.exceptions import FieldError
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from . import settings as app_settings
+from .cache import plan_cache
+from .cache import bump_version
+from .cache import usage_cache
+from .stats import stats_buffer
+
+
+HISTORY_SLOT_RETRIES = 3
+LAST_USED_INTERVAL = 3600
 
 
 def default_dict():
     return dict()
 
 
+def hash_querydict(querydict):
+    """
+    Return a canonical and order-independent hash of a querydict.
+    """
+    data = json.dumps(querydict, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def validate_database(value):
+    if value not in connections.databases:
+        raise ValidationError(_('Unknown database: %(alias)s'), params=dict(alias=value))
+
+
+def get_content_type(model):
+    """
+    Return the content-type of a model as used by its admin urls. Content-types
+    are cached by the ContentType manager.
+    """
+    return ContentType.objects.get_for_model(model, for_concrete_model=False)
+
+
 class JSONField(models.TextField):
     """
     A very raw and simple JSONField.
@@ -36,18 +75,82 @@ class JSONField(models.TextField):
         return json.dumps(value, cls=DjangoJSONEncoder)
 
 
+class FilterQueryEntry(namedtuple('FilterQueryEntry', [
+        'id', 'name', 'description', 'persistent', 'for_everyone', 'user_id',
+        'querydict_hash', 'database', 'run_count', 'mean_time', 'p95_time', 'last_row_count',
+        'created'])):
+    """
+    A lightweight representation of a filter query as used by the sidebar.
+    """
+    __slots__ = ()
+
+    @property
+    def stats(self):
+        return format_stats(self)
+
+
+def format_stats(query):
+    """
+    Summarize the execution statistics of a filter query.
+    """
+    if not query.run_count:
+        return ''
+    stats = [_('%(runs)s runs') % dict(runs=query.run_count)]
+    if query.mean_time is not None:
+        stats.append(_('mean %(time).1f ms') % dict(time=query.mean_time * 1000))
+        stats.append(_('p95 %(time).1f ms') % dict(time=query.p95_time * 1000))
+    if query.last_row_count is not None:
+        stats.append(_('%(rows)s rows') % dict(rows=query.last_row_count))
+    return ', '.join(stats)
+
+
+# On a database of their own filter queries reference content-types and users
+# living on another database. Then they are referenced without constraint and
+# deleted by the receivers below.
+if app_settings.DATABASE:
+    REFERENCE_OPTIONS = dict(on_delete=models.DO_NOTHING, db_constraint=False)
+else:
+    REFERENCE_OPTIONS = dict(on_delete=models.CASCADE)
+
+
 class FilterQuery(models.Model):
     name = models.CharField(max_length=128)
     description = models.TextField(blank=True)
     persistent = models.BooleanField(default=False)
     querydict = JSONField(default=default_dict)
+    querydict_hash = models.CharField(max_length=40, blank=True, editable=False, db_index=True)
+    slot = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    last_used = models.DateTimeField(default=timezone.now, null=True, blank=True, editable=False)
+    run_count = models.PositiveIntegerField(default=0, editable=False)
+    sample_count = models.PositiveIntegerField(default=0, editable=False)
+    last_run = models.DateTimeField(null=True, blank=True, editable=False)
+    mean_time = models.FloatField(null=True, blank=True, editable=False)
+    p95_time = models.FloatField(null=True, blank=True, editable=False)
+    last_row_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created = models.DateTimeField(auto_now_add=True)
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, **REFERENCE_OPTIONS)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, **REFERENCE_OPTIONS)
     for_everyone = models.BooleanField(default=False)
+    database = models.CharField(max_length=64, blank=True, validators=[validate_database])
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            # personal filter queries and the history of a user
+            models.Index(
+                fields=['content_type', 'user', 'persistent', '-created'],
+                name='fq_personal_idx'),
+            # global filter queries (a partial index where supported)
+            models.Index(
+                fields=['content_type', 'for_everyone', 'persistent', '-created'],
+                condition=models.Q(for_everyone=True, persistent=True),
+                name='fq_global_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'content_type', 'slot'],
+                name='fq_history_slot_uniq'),
+        ]
         permissions = [('can_handle_global_filterqueries', 'Can handle global FilterQueries')]
 
     @staticmethod
@@ -55,7 +158,7 @@ class FilterQuery(models.Model):
         perm = 'django_admin_filter.can_handle_global_filterqueries'
         return user.has_perm(perm)
 
-    def save(self, *args, **kwargs):
+    def set_defaults(self):
         # create a generic name if missing
         if not self.name:
             if settings.USE_TZ:
@@ -68,11 +171,24 @@ class FilterQuery(models.Model):
         if not self.description:
             self.description = self.pretty_query
 
+    def save(self, *args, **kwargs):
+        self.set_defaults()
+        self.querydict_hash = hash_querydict(self.querydict)
+
+        # only history entries occupy a slot of the ring buffer
+        if self.persistent:
+            self.slot = None
+
+        # save new history entries to the ring buffer
+        if self.pk is None and not self.persistent and self.uses_history_slots():
+            self.save_to_history_slot()
+            return
+
         # save filter-query
         super().save(*args, **kwargs)
 
         # truncate history
-        if app_settings.TRUNCATE_HISTORY and not self.persistent:
+        if app_settings.TRUNCATE_HISTORY and not self.persistent and not self.uses_history_slots():
             history = FilterQuery.objects.filter(
                 user=self.user,
                 content_type=self.content_type,
@@ -80,6 +196,66 @@ class FilterQuery(models.Model):
             )[app_settings.HISTORY_LIMIT:]
             FilterQuery.objects.filter(id__in=[f.id for f in history]).delete()
 
+    @staticmethod
+    def uses_history_slots():
+        return app_settings.HISTORY_MODE == 'ring' and app_settings.HISTORY_LIMIT > 0
+
+    def save_to_history_slot(self):
+        """
+        Save a new history entry to a free slot of the user's history. If all
+        slots are taken the oldest entry is overwritten in place - together
+        with its statistics and query plans. The history rows are locked while a slot is selected. Concurrent requests that
+        nevertheless pick the same free slot fail on the unique constraint and
+        try it again.
+        """
+        history = FilterQuery.objects.filter(
+            user=self.user,
+            content_type=self.content_type,
+            persistent=False
+        ).select_for_update()
+        for attempt in range(HISTORY_SLOT_RETRIES):
+            try:
+                with transaction.atomic(using=router.db_for_write(FilterQuery)):
+                    # Sort by the created time of the locked rows, since rows
+                    # updated by a concurrent request could be out of order.
+                    entries = sorted(history.values_list('created', 'pk', 'slot'))
+                    if len(entries) < app_settings.HISTORY_LIMIT:
+                        taken = set(slot for created, pk, slot in entries)
+                        self.slot = min(set(range(app_settings.HISTORY_LIMIT)) - taken)
+                        super().save(force_insert=True)
+                    else:
+                        created, self.pk, self.slot = entries[0]
+                        self.reset_stats()
+                        super().save(force_update=True)
+                        self.plans.all().delete()
+                        stats_buffer.discard(self.pk)
+                        usage_cache.delete(self.pk)
+                return
+            except IntegrityError:
+                self.pk = None
+                if attempt == HISTORY_SLOT_RETRIES - 1:
+                    raise
+
+    def reset_stats(self):
+        self.created = self.last_used = timezone.now()
+        self.run_count = self.sample_count = 0
+        self.last_run = self.mean_time = self.p95_time = self.last_row_count = None
+
+    def get_history_duplicates(self):
+        """
+        Return the history entries of the same user and content-type with an
+        identical querydict.
+        """
+        return FilterQuery.objects.filter(
+            user_id=self.user_id,
+            content_type_id=self.content_type_id,
+            persistent=False,
+            querydict_hash=hash_querydict(self.querydict)
+        )
+
+    def get_history_duplicate(self):
+        return self.get_history_duplicates().first()
+
     @property
     def pretty_query(self):
         lines = list()
@@ -88,6 +264,59 @@ class FilterQuery(models.Model):
             lines.append(line)
         return '\n'.join(lines)
 
+    @property
+    def stats(self):
+        return format_stats(self)
+
     @property
     def urlquery(self):
         return urlencode(self.querydict)
+
+
+class FilterQueryPlan(models.Model):
+    filter_query = models.ForeignKey(FilterQuery, on_delete=models.CASCADE, related_name='plans')
+    querydict_hash = models.CharField(max_length=40, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    vendor = models.CharField(max_length=32)
+    plan = models.TextField()
+    duration = models.FloatField(null=True, blank=True)
+    seq_scan = models.BooleanField(default=False)
+    disk_sort = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return '{} ({})'.format(self.filter_query_id, self.created)
+
+
+def touch_filter_query(pk):
+    """
+    Update the last_used time of a filter query. To not write on each request
+    the time is only updated once in LAST_USED_INTERVAL seconds by each
+    process.
+    """
+    now = time.monotonic()
+    last_touched = usage_cache.get(pk)
+    if last_touched is None or now - last_touched > LAST_USED_INTERVAL:
+        usage_cache.set(pk, now)
+        FilterQuery.objects.filter(pk=pk).update(last_used=timezone.now())
+
+
+@receiver(post_save, sender=FilterQuery)
+@receiver(post_delete, sender=FilterQuery)
+def invalidate_caches(sender, instance, **kwargs):
+    plan_cache.delete(instance.pk)
+    bump_version('sidebar:{}'.format(instance.content_type_id))
+
+
+@receiver(post_delete, sender=ContentType)
+def delete_content_type_filter_queries(sender, instance, **kwargs):
+    if app_settings.DATABASE:
+        FilterQuery.objects.filter(content_type_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_filter_queries(sender, instance, **kwargs):
+    if app_settings.DATABASE:
+        FilterQuery.objects.filter(user_id=instance.pk).delete()
@@ -0,0 +1,197 @@
+import json
+import datetime
+import base64
+import binascii
+from django.core.paginator import InvalidPage
+from django.core.paginator import Page
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from . import settings as app_settings
+from .counts import count_queryset
+
+CURSOR_VAR = 'cursor'
+
+
+class FilterPaginator(Paginator):
+    """
+    A paginator for admin changelists that uses cached and estimated counts.
+    Use it as paginator of your ModelAdmin together with the
+    django_admin_filter/change_list.html template.
+    """
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return count_queryset(self.object_list)
+        return super().count
+
+
+class UnknownCount(int):
+    """
+    A row count that was not determined. Its value is just big enough to let
+    the changelist paginate without offering to show all rows.
+    """
+    unknown = True
+
+
+def get_keyset(queryset):
+    """
+    Return the ordering of a queryset as list of (field, descending) pairs if
+    it could be used to seek pages. That is if it consists of non-nullable
+    fields of the model itself and ends with a unique one. Otherwise return
+    None.
+    """
+    opts = queryset.model._meta
+    ordering = queryset.query.order_by or opts.ordering
+    keyset = list()
+    for name in ordering:
+        if not isinstance(name, str) or name == '?':
+            return None
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.is_relation or field.null:
+            return None
+        keyset.append((field, descending))
+        if field.unique:
+            return keyset
+    return None
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Unlike the DjangoJSONEncoder keep the microseconds of datetimes and times,
+    since a cursor must point exactly to the last row of a page.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(keyset, values):
+    names = [('-' if d else '') + f.attname for f, d in keyset]
+    data = json.dumps([names, values], cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(keyset, cursor):
+    """
+    Return the field values of a cursor. Cursors of another ordering, e.g. if
+    the changelist was sorted differently, are ignored.
+    """
+    try:
+        cursor = cursor + '=' * (-len(cursor) % 4)
+        names, values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if names != [('-' if d else '') + f.attname for f, d in keyset]:
+            return None
+        return [f.to_python(v) for (f, d), v in zip(keyset, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        raise InvalidPage('Invalid cursor')
+
+
+def seek(keyset, values):
+    """
+    Build the condition for the rows following the values of the keyset.
+    """
+    condition = Q()
+    for index, (field, descending) in enumerate(keyset):
+        lookup = '{}__{}'.format(field.attname, 'lt' if descending else 'gt')
+        equal = dict((f.attname, v) for (f, d), v in zip(keyset[:index], values))
+        condition |= Q(**equal) & Q(**{lookup: values[index]})
+    return condition
+
+
+class KeysetPage(Page):
+    def __init__(self, object_list, paginator, next_cursor):
+        super().__init__(object_list, 1, paginator)
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    def has_previous(self):
+        return bool(self.paginator.cursor)
+
+
+class KeysetPaginator(FilterPaginator):
+    """
+    A paginator for admin changelists seeking the rows of the next page by the
+    values of the last row instead of using OFFSET. This way the deepest pages
+    are as fast as the first one, provided the ordering is backed by an index.
+    Use it together with the KeysetPaginationMixin and the CustomFilter. If
+    the ordering is not suitable, it pages by OFFSET as usual.
+    """
+    cursor = None
+    max_show_all = 0
+
+    @cached_property
+    def keyset(self):
+        if isinstance(self.object_list, QuerySet):
+            return get_keyset(self.object_list)
+        return None
+
+    @cached_property
+    def count(self):
+        if not self.keyset or not app_settings.KEYSET_SKIP_COUNT:
+            return super().count
+        try:
+            rows, next_cursor = self.rows
+        except InvalidPage:
+            # let the changelist fail on page() as for invalid page numbers
+            return UnknownCount(max(self.per_page, self.max_show_all) + 1)
+        if not next_cursor and not self.cursor:
+            return len(rows)
+        return UnknownCount(max(self.per_page, self.max_show_all) + 1)
+
+    @cached_property
+    def rows(self):
+        """
+        The rows of the current page and the cursor of the next page. One
+        row more than needed is fetched to know if there is a next page.
+        """
+        queryset = self.object_list
+        values = decode_cursor(self.keyset, self.cursor) if self.cursor else None
+        if values:
+            queryset = queryset.filter(seek(self.keyset, values))
+        rows = list(queryset[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            return rows, None
+        rows = rows[:self.per_page]
+        values = [getattr(rows[-1], f.attname) for f, d in self.keyset]
+        return rows, encode_cursor(self.keyset, values)
+
+    def page(self, number):
+        if not self.keyset:
+            return super().page(number)
+        rows, next_cursor = self.rows
+        return KeysetPage(rows, self, next_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin mixin paging the changelist by the KeysetPaginator. The cursor
+    of the current page is passed by the query string.
+    """
+    paginator = KeysetPaginator
+    change_list_template = 'django_admin_filter/change_list.html'
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        paginator.cursor = request.GET.get(CURSOR_VAR)
+        paginator.max_show_all = self.list_max_show_all
+        return paginator
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # like the page number the cursor is reset by any link of the changelist
+        changelist.params.pop(CURSOR_VAR, None)
+        return changelist
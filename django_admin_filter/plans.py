@@ -0,0 +1,123 @@
+import re
+from django.db import connections
+
+from . import settings as app_settings
+from .cache import LRUCache
+from .models import FilterQueryPlan
+
+
+def scans_postgresql(plan):
+    return re.findall(r'Seq Scan on (\w+)', plan)
+
+
+def scans_sqlite(plan):
+    scans = re.findall(r'SCAN (?:TABLE )?(\w+)(.*)', plan)
+    return [table for table, rest in scans if 'INDEX' not in rest]
+
+
+def scans_mysql(plan):
+    # rows of the traditional format: id select_type table partitions type ...
+    return re.findall(r'^\S+ \S+ (\w+) \S+ ALL\b', plan, re.MULTILINE)
+
+
+def table_rows_postgresql(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def table_rows_mysql(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        row = cursor.fetchone()
+    return (row[0] or 0) if row else 0
+
+
+def table_rows_sqlite(connection, table):
+    # The highest rowid is a cheap approximation of the table size.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(rowid) FROM {}'.format(connection.ops.quote_name(table)))
+        row = cursor.fetchone()
+    return row[0] or 0
+
+
+# functions and patterns to inspect query plans by database vendor
+SCANS = dict(
+    postgresql=scans_postgresql,
+    sqlite=scans_sqlite,
+    mysql=scans_mysql,
+)
+TABLE_ROWS = dict(
+    postgresql=table_rows_postgresql,
+    sqlite=table_rows_sqlite,
+    mysql=table_rows_mysql,
+)
+DISK_SORTS = dict(
+    postgresql=r'Sort Method: external|Disk: \d+',
+    sqlite=r'USE TEMP B-TREE',
+    mysql=r'Using filesort|Using temporary',
+)
+
+
+def has_seq_scan(connection, plan):
+    """
+    Whether the plan scans a table with at least ADMIN_FILTER_PLAN_SEQ_SCAN_ROWS
+    rows sequentially.
+    """
+    scans = SCANS.get(connection.vendor)
+    if not scans:
+        return False
+    table_rows = TABLE_ROWS[connection.vendor]
+    tables = set(scans(plan))
+    return any(table_rows(connection, t) >= app_settings.PLAN_SEQ_SCAN_ROWS for t in tables)
+
+
+def has_disk_sort(connection, plan):
+    """
+    Whether the plan sorts using temporary files.
+    """
+    pattern = DISK_SORTS.get(connection.vendor)
+    return bool(pattern and re.search(pattern, plan))
+
+
+def capture_plan(query, queryset, analyze=False, duration=None):
+    """
+    Explain the queryset of a filter query and store the plan as
+    FilterQueryPlan. With analyze the query is executed by the database where
+    supported, which reveals sorts spilling to disk on PostgreSQL.
+    """
+    connection = connections[queryset.db]
+    options = dict()
+    if analyze and connection.vendor in ('postgresql', 'mysql'):
+        options['analyze'] = True
+    plan = queryset.explain(**options)
+    return FilterQueryPlan.objects.create(
+        filter_query_id=query.id,
+        querydict_hash=query.querydict_hash,
+        vendor=connection.vendor,
+        plan=plan,
+        duration=duration,
+        seq_scan=has_seq_scan(connection, plan),
+        disk_sort=has_disk_sort(connection, plan))
+
+
+# filter queries with recently captured plans
+captured = LRUCache(1024, app_settings.PLAN_CAPTURE_INTERVAL)
+
+
+def capture_slow_plan(query, queryset, duration):
+    """
+    Capture the plan of a filter query if its execution took longer than the
+    ADMIN_FILTER_SLOW_FILTER_THRESHOLD. Each process captures the plan of a
+    filter query only once in ADMIN_FILTER_PLAN_CAPTURE_INTERVAL seconds.
+    """
+    threshold = app_settings.SLOW_FILTER_THRESHOLD
+    if threshold is None or duration < threshold:
+        return None
+    if captured.get(query.id):
+        return None
+    captured.set(query.id, True)
+    return capture_plan(query, queryset, duration=duration)
@@ -0,0 +1,59 @@
+import time
+from django.db import router
+
+from . import settings as app_settings
+from .models import FilterQuery
+
+PIN_SESSION_KEY = '_admin_filter_pinned'
+
+
+def get_replica(model, query=None):
+    """
+    Return the database alias filtered querysets of a model are read from. The
+    database of a filter query takes precedence over the ADMIN_FILTER_REPLICAS
+    setting by model label, which takes precedence over ADMIN_FILTER_REPLICA.
+    None means the default routing.
+    """
+    if query is not None and query.database:
+        return query.database
+    for label, alias in app_settings.REPLICAS.items():
+        if label.lower() == model._meta.label_lower:
+            return alias
+    return app_settings.REPLICA
+
+
+def pin_primary(request):
+    """
+    Read from the primary database for the next ADMIN_FILTER_REPLICA_PIN_TIME
+    seconds of the session. Call it after writing a filter query, so that the
+    redirected request sees the write even if the replica lags behind.
+    """
+    session = getattr(request, 'session', None)
+    if session is not None and app_settings.REPLICA_PIN_TIME:
+        session[PIN_SESSION_KEY] = time.time() + app_settings.REPLICA_PIN_TIME
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def get_read_database(request, model, query=None):
+    """
+    Return the database alias the filtered querysets of a request are read
+    from. Pinned sessions read from the default routing.
+    """
+    if is_pinned(request):
+        return None
+    return get_replica(model, query)
+
+
+def get_filter_query_database(request):
+    """
+    Return the database alias filter queries are read from. Pinned sessions
+    read them from the database they are written to. Otherwise None means the
+    default routing.
+    """
+    if is_pinned(request):
+        return router.db_for_write(FilterQuery)
+    return None
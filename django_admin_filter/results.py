@@ -0,0 +1,96 @@
+from array import array
+from django.db import models
+from django.db.models import Q
+
+from . import settings as app_settings
+from .cache import TieredCache
+from .cache import get_version
+from .cache import model_namespace
+
+
+class PKRanges:
+    """
+    A compact, run-length encoded set of integer primary keys. Each run of
+    consecutive keys is stored as a pair of its first and last key.
+    """
+    def __init__(self, bounds=None):
+        self.bounds = array('q', bounds or [])
+
+    @classmethod
+    def from_pks(cls, pks, max_ranges=None):
+        """
+        Build the ranges from ascending primary keys. Return None if there are
+        more than max_ranges runs.
+        """
+        ranges = cls()
+        start = stop = None
+        for pk in pks:
+            if stop is not None and pk == stop + 1:
+                stop = pk
+                continue
+            if start is not None:
+                ranges.bounds.extend((start, stop))
+                if max_ranges and len(ranges) >= max_ranges:
+                    return None
+            start = stop = pk
+        if start is not None:
+            ranges.bounds.extend((start, stop))
+        return ranges
+
+    def __len__(self):
+        return len(self.bounds) // 2
+
+    def __iter__(self):
+        bounds = iter(self.bounds)
+        return zip(bounds, bounds)
+
+    def __getstate__(self):
+        return dict(bounds=self.bounds.tobytes())
+
+    def __setstate__(self, state):
+        self.bounds = array('q')
+        self.bounds.frombytes(state['bounds'])
+
+    @property
+    def count(self):
+        """
+        The number of primary keys.
+        """
+        return sum(stop - start + 1 for start, stop in self)
+
+    def as_q(self):
+        """
+        Return a Q object matching the primary keys. Single keys are collected
+        within one pk__in lookup.
+        """
+        singles = [start for start, stop in self if start == stop]
+        q = Q(pk__in=singles)
+        for start, stop in self:
+            if start != stop:
+                q |= Q(pk__range=(start, stop))
+        return q
+
+
+# marks results with too many ranges to be cached
+FRAGMENTED = 'fragmented'
+result_cache = TieredCache('results', app_settings.RESULT_CACHE_SIZE, app_settings.RESULT_CACHE_TIMEOUT)
+
+
+def supports_result_cache(model):
+    return isinstance(model._meta.pk, (models.AutoField, models.IntegerField))
+
+
+def get_pk_ranges(key, model, build_queryset):
+    """
+    Return the cached PKRanges for a key and a model. On a cache miss the
+    ranges are built from the queryset returned by build_queryset. Returns None
+    if the result is too fragmented to be cached.
+    """
+    key = '{}:{}'.format(key, get_version(model_namespace(model)))
+    ranges = result_cache.get(key)
+    if ranges is None:
+        pks = build_queryset().order_by('pk').values_list('pk', flat=True)
+        ranges = PKRanges.from_pks(pks.iterator(), app_settings.RESULT_CACHE_MAX_RANGES)
+        # Remember fragmented results as well to not scan them again.
+        result_cache.set(key, FRAGMENTED if ranges is None else ranges)
+    return None if ranges == FRAGMENTED else ranges
@@ -0,0 +1,49 @@
+from django.db import router
+
+from . import settings as app_settings
+
+
+class FilterQueryRouter:
+    """
+    Database router storing the filter queries on the database given by
+    ADMIN_FILTER_DATABASE. Add it to the DATABASE_ROUTERS setting. Users and
+    content-types are referenced by id only, so they could stay on another
+    database.
+    """
+    app_label = 'django_admin_filter'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return app_settings.DATABASE
+        if self.is_related(**hints):
+            return router.db_for_read(model)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return app_settings.DATABASE
+        if self.is_related(**hints):
+            return router.db_for_write(model)
+        return None
+
+    def is_related(self, instance=None, **hints):
+        """
+        Whether a user or content-type is accessed through a filter query. They
+        are routed as usual instead of using the database of the filter query.
+        """
+        return bool(app_settings.DATABASE) and instance is not None and instance._meta.app_label == self.app_label
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.app_label in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not app_settings.DATABASE:
+            return None
+        if app_label == self.app_label:
+            return db == app_settings.DATABASE
+        # no other tables on the database of the filter queries
+        if db == app_settings.DATABASE:
+            return False
+        return None
@@ -3,4 +3,39 @@ from django.conf import settings
 
 HISTORY_LIMIT = getattr(settings, 'ADMIN_FILTER_HISTORY_LIMIT', 3)
 TRUNCATE_HISTORY = getattr(settings, 'ADMIN_FILTER_TRUNCATE_HISTORY', True)
+HISTORY_MODE = getattr(settings, 'ADMIN_FILTER_HISTORY_MODE', 'truncate')
+HISTORY_BACKEND = getattr(settings, 'ADMIN_FILTER_HISTORY_BACKEND', 'db')
+HISTORY_TTL = getattr(settings, 'ADMIN_FILTER_HISTORY_TTL', None)
+UNUSED_FILTER_TTL = getattr(settings, 'ADMIN_FILTER_UNUSED_FILTER_TTL', None)
+PURGE_CHUNK_SIZE = getattr(settings, 'ADMIN_FILTER_PURGE_CHUNK_SIZE', 1000)
+EXPORT_CHUNK_SIZE = getattr(settings, 'ADMIN_FILTER_EXPORT_CHUNK_SIZE', 2000)
+SIDEBAR_LIMIT = getattr(settings, 'ADMIN_FILTER_SIDEBAR_LIMIT', None)
+SIDEBAR_PAGE_SIZE = getattr(settings, 'ADMIN_FILTER_SIDEBAR_PAGE_SIZE', 50)
+FILTERSETS = getattr(settings, 'ADMIN_FILTER_FILTERSETS', dict())
 URL_PATH = getattr(settings, 'ADMIN_FILTER_URL_PATH', 'filter').strip('/') + '/'
+PLAN_CACHE_SIZE = getattr(settings, 'ADMIN_FILTER_PLAN_CACHE_SIZE', 256)
+CACHE = getattr(settings, 'ADMIN_FILTER_CACHE', None)
+CACHE_TIMEOUT = getattr(settings, 'ADMIN_FILTER_CACHE_TIMEOUT', 300)
+SIDEBAR_CACHE_SIZE = getattr(settings, 'ADMIN_FILTER_SIDEBAR_CACHE_SIZE', 1024)
+RESULT_CACHE = getattr(settings, 'ADMIN_FILTER_RESULT_CACHE', False)
+RESULT_CACHE_SIZE = getattr(settings, 'ADMIN_FILTER_RESULT_CACHE_SIZE', 64)
+RESULT_CACHE_TIMEOUT = getattr(settings, 'ADMIN_FILTER_RESULT_CACHE_TIMEOUT', 600)
+RESULT_CACHE_MAX_RANGES = getattr(settings, 'ADMIN_FILTER_RESULT_CACHE_MAX_RANGES', 100)
+COUNT_CACHE_SIZE = getattr(settings, 'ADMIN_FILTER_COUNT_CACHE_SIZE', 256)
+COUNT_CACHE_TIMEOUT = getattr(settings, 'ADMIN_FILTER_COUNT_CACHE_TIMEOUT', 0)
+ESTIMATE_COUNT_THRESHOLD = getattr(settings, 'ADMIN_FILTER_ESTIMATE_COUNT_THRESHOLD', None)
+KEYSET_SKIP_COUNT = getattr(settings, 'ADMIN_FILTER_KEYSET_SKIP_COUNT', False)
+FACETS = getattr(settings, 'ADMIN_FILTER_FACETS', False)
+FACET_CACHE_SIZE = getattr(settings, 'ADMIN_FILTER_FACET_CACHE_SIZE', 256)
+FACET_CACHE_TIMEOUT = getattr(settings, 'ADMIN_FILTER_FACET_CACHE_TIMEOUT', 60)
+DATABASE = getattr(settings, 'ADMIN_FILTER_DATABASE', None)
+REPLICA = getattr(settings, 'ADMIN_FILTER_REPLICA', None)
+REPLICAS = getattr(settings, 'ADMIN_FILTER_REPLICAS', dict())
+REPLICA_PIN_TIME = getattr(settings, 'ADMIN_FILTER_REPLICA_PIN_TIME', 10)
+STATS = getattr(settings, 'ADMIN_FILTER_STATS', False)
+STATS_SAMPLE_RATE = getattr(settings, 'ADMIN_FILTER_STATS_SAMPLE_RATE', 0.1)
+STATS_FLUSH_SIZE = getattr(settings, 'ADMIN_FILTER_STATS_FLUSH_SIZE', 100)
+STATS_FLUSH_INTERVAL = getattr(settings, 'ADMIN_FILTER_STATS_FLUSH_INTERVAL', 60)
+SLOW_FILTER_THRESHOLD = getattr(settings, 'ADMIN_FILTER_SLOW_FILTER_THRESHOLD', None)
+PLAN_CAPTURE_INTERVAL = getattr(settings, 'ADMIN_FILTER_PLAN_CAPTURE_INTERVAL', 3600)
+PLAN_SEQ_SCAN_ROWS = getattr(settings, 'ADMIN_FILTER_PLAN_SEQ_SCAN_ROWS', 10000)
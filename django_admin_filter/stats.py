@@ -0,0 +1,155 @@
+import math
+import time
+import random
+import threading
+from django.core.signals import request_finished
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Value
+from django.db.models import ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import settings as app_settings
+from .cache import bump_version
+
+
+class Stats:
+    """
+    The buffered statistics of a single filter query.
+    """
+    def __init__(self):
+        self.runs = 0
+        self.times = list()
+        self.last_run = None
+        self.last_row_count = None
+
+
+class QueryTimer:
+    """
+    Execute wrapper summing up the execution time of the statements run on a
+    connection between start and stop - e.g. the queries of a changelist. It
+    is stopped at the latest when the request is finished.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.thread = threading.get_ident()
+        self.uid = 'django_admin_filter.timer.{}'.format(id(self))
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+
+    def start(self):
+        self.connection.execute_wrappers.append(self)
+        request_finished.connect(self.stop, weak=False, dispatch_uid=self.uid)
+
+    def stop(self, **kwargs):
+        """
+        Remove the wrapper and return the summed up duration.
+        """
+        # requests of other threads finish as well
+        if threading.get_ident() != self.thread:
+            return None
+        if self in self.connection.execute_wrappers:
+            self.connection.execute_wrappers.remove(self)
+        request_finished.disconnect(dispatch_uid=self.uid)
+        return self.duration
+
+
+def rolling_mean(field, total, count):
+    """
+    Combine the stored value of a field with the mean of new samples weighted
+    by the number of samples. Since the stored sample_count is referenced, the
+    expression must be set before the sample_count itself (MySQL evaluates the
+    assignments of an UPDATE from left to right).
+    """
+    stored = Coalesce(F(field), Value(0.0)) * F('sample_count')
+    expression = (stored + Value(total)) / (F('sample_count') + Value(count))
+    return ExpressionWrapper(expression, output_field=FloatField())
+
+
+class StatsBuffer:
+    """
+    Collect execution statistics of filter queries in memory and write them
+    in batches. Each flush issues one UPDATE per filter query using F()
+    expressions, so that concurrent processes do not overwrite each other.
+    The sidebar versions of the flushed filter queries are bumped.
+    A flush happens when ADMIN_FILTER_STATS_FLUSH_SIZE runs were recorded or
+    the last flush is ADMIN_FILTER_STATS_FLUSH_INTERVAL seconds ago.
+    """
+    def __init__(self):
+        self._data = dict()
+        self._runs = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def sample(self):
+        """
+        Whether the next run should be timed.
+        """
+        return random.random() < app_settings.STATS_SAMPLE_RATE
+
+    def record(self, pk, duration=None, row_count=None):
+        with self._lock:
+            stats = self._data.setdefault(pk, Stats())
+            stats.runs += 1
+            stats.last_run = timezone.now()
+            if duration is not None:
+                stats.times.append(duration)
+                stats.last_row_count = row_count
+            self._runs += 1
+            due = (self._runs >= app_settings.STATS_FLUSH_SIZE
+                   or time.monotonic() - self._last_flush >= app_settings.STATS_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def discard(self, pk):
+        """
+        Drop the runs of a filter query that were not flushed yet.
+        """
+        with self._lock:
+            self._data.pop(pk, None)
+
+    def flush(self):
+        with self._lock:
+            data, self._data = self._data, dict()
+            self._runs = 0
+            self._last_flush = time.monotonic()
+
+        from .models import FilterQuery
+        for pk, stats in data.items():
+            FilterQuery.objects.filter(pk=pk).update(**self.get_updates(stats))
+
+        # The sidebar entries show the stats. Since update() sends no signals
+        # their versions are bumped here.
+        if data:
+            queryset = FilterQuery.objects.filter(pk__in=list(data))
+            for content_type_id in set(queryset.values_list('content_type_id', flat=True)):
+                bump_version('sidebar:{}'.format(content_type_id))
+
+    def get_updates(self, stats):
+        updates = dict()
+        if stats.times:
+            times = sorted(stats.times)
+            count = len(times)
+            p95 = times[math.ceil(count * 0.95) - 1]
+            # The p95 is approximated as rolling mean of the p95 of each batch.
+            updates['mean_time'] = rolling_mean('mean_time', sum(times), count)
+            updates['p95_time'] = rolling_mean('p95_time', p95 * count, count)
+            updates['sample_count'] = F('sample_count') + count
+            updates['last_row_count'] = stats.last_row_count
+        updates['run_count'] = F('run_count') + stats.runs
+        updates['last_run'] = stats.last_run
+        updates['last_used'] = stats.last_run
+        return updates
+
+
+stats_buffer = StatsBuffer()
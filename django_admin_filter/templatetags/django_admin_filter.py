@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from django.template import Library
+from django.contrib.admin.templatetags.admin_list import pagination
 from .. import settings
+from ..paginator import CURSOR_VAR
 
 
 register = Library()
@@ -11,16 +13,20 @@ def urlpath():
     return settings.URL_PATH
 
 
-@register.filter
-def persistent_everyone(filter):
-    return [f for f in filter[1:] if f['filter'].persistent and f['filter'].for_everyone]
-
-
-@register.filter
-def persistent_personal(filter):
-    return [f for f in filter[1:] if f['filter'].persistent and not f['filter'].for_everyone]
-
-
-@register.filter
-def history(filter):
-    return [f for f in filter[1:] if not f['filter'].persistent]
+@register.simple_tag
+def cursor_query_string(cl, cursor=None):
+    """
+    The query string of the changelist for the page of a keyset cursor.
+    """
+    if cursor:
+        return cl.get_query_string({CURSOR_VAR: cursor})
+    return cl.get_query_string(remove=[CURSOR_VAR])
+
+
+@register.inclusion_tag('django_admin_filter/pagination.html')
+def filter_pagination(cl):
+    """
+    The pagination of the changelist supporting estimated counts and keyset
+    cursors. It is used by the django_admin_filter/change_list.html template.
+    """
+    return pagination(cl)
@@ -1,9 +1,11 @@
 from django.conf.urls import re_path
-from .views import CreateFilterQueryView, UpdateFilterQueryView
+from .views import CreateFilterQueryView, UpdateFilterQueryView, SidebarEntriesView, ExportFilterQueryView
 from . import settings
 
 
 urlpatterns = [
     re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}$'.format(settings.URL_PATH), CreateFilterQueryView.as_view()),
-    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}(?P<pk>\d+)/$'.format(settings.URL_PATH), UpdateFilterQueryView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}entries/$'.format(settings.URL_PATH), SidebarEntriesView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}(?P<pk>\d+|h[0-9a-f]+)/$'.format(settings.URL_PATH), UpdateFilterQueryView.as_view()),
+    re_path(r'^(?P<app_label>\w+)/(?P<model>\w+)/{}(?P<pk>\d+)/export/$'.format(settings.URL_PATH), ExportFilterQueryView.as_view()),
 ]
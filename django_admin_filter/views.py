@@ -1,24 +1,52 @@
 import html.parser
+import hashlib
 from decimal import Decimal
 
 from django import forms
 from django.http import Http404
 from django.http import HttpResponseRedirect
 from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
 from django.utils.text import format_lazy
+from django.utils.text import slugify
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
 from django.views.generic.base import TemplateResponseMixin
+from django.views.generic.base import View
 from django.views.generic.edit import BaseCreateView, BaseUpdateView
+from django.contrib.admin.sites import all_sites
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
+from . import settings as app_settings
+from .cache import get_version
+from .export import filter_query_queryset
+from .export import iter_csv
+from .filters import sidebar_page
 from .filterset import AdminFilterSet
+from .history import get_history_backend
+from .history import is_history_id
 from .models import FilterQuery
+from .replicas import get_filter_query_database
+from .replicas import get_read_database
+from .replicas import pin_primary
 from .forms import FilterForm
 
 
+def get_model_admin(model):
+    """
+    Return the ModelAdmin a model is registered with by any admin site.
+    """
+    for site in all_sites:
+        if model in site._registry:
+            return site._registry[model]
+    return None
+
+
 def can_view_related_model(func):
     """
     Decorator for view-methods to check permission to view the filtered items.
@@ -37,7 +65,7 @@ def can_handle_filterquery(func):
     """
     def wrapper(self, request, **kwargs):
         obj = self.get_object()
-        is_owner = obj.user == self.request.user
+        is_owner = obj.user_id == self.request.user.pk
         can_handle = obj.for_everyone and obj.has_global_perm(self.request.user)
         if not is_owner and not can_handle:
             raise PermissionDenied
@@ -49,11 +77,12 @@ def can_handle_filterquery(func):
 def setup_filterclass(func):
     """
     Extract the contenttype from url-paramerters and setup the filter-class.
+    The contenttype is looked up by the cache of the ContentType manager.
     """
     def wrapper(self, request, **kwargs):
         params = dict(app_label=kwargs['app_label'], model=kwargs['model'])
         try:
-            self.content_type_obj = ContentType.objects.get(**params)
+            self.content_type_obj = ContentType.objects.get_by_natural_key(**params)
         except ContentType.DoesNotExist:
             msg = format_lazy(_("No model '{model}' in app '{app_label}'"), **params)
             raise Http404(msg)
@@ -83,17 +112,27 @@ class BaseFilterQueryView(LoginRequiredMixin, TemplateResponseMixin):
         else:
             return self.form_invalid(form, query_form)
 
+    def get_object(self, queryset=None):
+        """
+        Return the filter query or a history entry of other backends than the
+        database as unsaved filter query.
+        """
+        if not is_history_id(self.kwargs.get('pk')):
+            return super().get_object(queryset)
+        entry = get_history_backend().get(self.request, self.content_type_obj.model_class(), self.kwargs['pk'])
+        if entry is None:
+            raise Http404(_('No filter query found matching the query'))
+        return FilterQuery(
+            name=entry.name, description=entry.description, querydict=entry.querydict,
+            content_type=self.content_type_obj, user=self.request.user)
+
     def get_querydict(self):
-        # TODO: Filter out FILTERS_NULL_CHOICE_VALUE for ChoiceFilter and
-        # 'unknown' for BooleanFields.
-        field_names = self.filterset_class().form.fields.keys()
-        querydict = dict(
-            (k, v) for k, v in self.request.POST.items()
-            if k in field_names and not v is str()
-        )
-        return querydict
+        return self.filterset_class.get_metadata().extract_querydict(self.request.POST)
 
-    def form_valid(self, form, query_form):
+    def prepare_object(self, form):
+        """
+        Setup the filter query from the forms without saving it.
+        """
         self.object = form.save(commit=False)
         if 'save' not in self.request.POST :
             self.object.id = None
@@ -102,12 +141,30 @@ class BaseFilterQueryView(LoginRequiredMixin, TemplateResponseMixin):
         self.object.persistent = 'save' in self.request.POST or 'save_new' in self.request.POST
         self.object.for_everyone = self.object.for_everyone and self.object.persistent
         self.object.user = self.request.user
+
+    def save_object(self):
+        """
+        Save persistent filter queries and pass others to the history backend.
+        A history entry saved as filter query leaves the history.
+        """
+        history = get_history_backend()
+        if not self.object.persistent:
+            self.object = history.add(self.request, self.object)
+            return
         self.object.save()
+        if is_history_id(self.kwargs.get('pk')):
+            history.delete(self.request, self.content_type_obj.model_class(), self.kwargs['pk'])
+
+    def form_valid(self, form, query_form):
+        self.prepare_object(form)
+        self.save_object()
 
         # check extra permission for global filterqueries
         if self.object.for_everyone and not self.object.has_global_perm(self.request.user):
             raise PermissionDenied
 
+        pin_primary(self.request)
+
         return HttpResponseRedirect(self.get_success_url()) 
 
     def form_invalid(self, form, query_form):
@@ -136,10 +193,9 @@ class BaseFilterQueryView(LoginRequiredMixin, TemplateResponseMixin):
         return filter.form
 
     def get_context_data(self, **kwargs):
-        query_form = self.get_query_form()
-        extra_context = dict(query_form=query_form)
-        extra_context.update(kwargs)
-        return super().get_context_data(**extra_context)
+        if 'query_form' not in kwargs:
+            kwargs['query_form'] = self.get_query_form()
+        return super().get_context_data(**kwargs)
 
 
 class CreateFilterQueryView(BaseFilterQueryView, BaseCreateView):
@@ -169,10 +225,96 @@ class UpdateFilterQueryView(BaseFilterQueryView, BaseUpdateView):
         self.object = self.get_object()
         return super().post(request, *args, **kwargs)
 
+    @setup_filterclass
     @can_view_related_model
     @can_handle_filterquery
     def delete(self, *args, **kwargs):
         self.object = self.get_object()
-        response = dict(id=self.object.id)
-        self.object.delete()
+        if is_history_id(self.kwargs['pk']):
+            get_history_backend().delete(self.request, self.content_type_obj.model_class(), self.kwargs['pk'])
+            response = dict(id=self.kwargs['pk'])
+        else:
+            response = dict(id=self.object.id)
+            self.object.delete()
+        pin_primary(self.request)
         return JsonResponse(response)
+
+
+class SidebarEntriesView(LoginRequiredMixin, View):
+    """
+    Return the persistent sidebar entries as json - paginated by keyset and
+    searchable by the q parameter. Supports conditional requests by ETag.
+    """
+    max_limit = 500
+
+    @setup_filterclass
+    @can_view_related_model
+    def get(self, request, **kwargs):
+        has_global_perm = FilterQuery.has_global_perm(request.user)
+
+        # With a shared cache the etag is derived from the sidebar version to
+        # answer conditional requests without querying the entries.
+        etag = None
+        if app_settings.CACHE:
+            version = get_version('sidebar:{}'.format(self.content_type_obj.id))
+            key = [version, request.user.pk, has_global_perm, sorted(request.GET.items())]
+            etag = quote_etag(hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+
+        try:
+            limit = min(int(request.GET.get('limit', app_settings.SIDEBAR_PAGE_SIZE)), self.max_limit)
+            entries = sidebar_page(
+                request.user,
+                self.content_type_obj.model_class(),
+                cursor=request.GET.get('cursor'),
+                search=request.GET.get('q', '').strip(),
+                limit=max(limit, 1),
+                using=get_filter_query_database(request))
+        except ValueError as exc:
+            return JsonResponse(dict(error=str(exc)), status=400)
+
+        data = dict(cursor=entries.cursor, entries=[dict(
+            id=entry.id,
+            name=entry.name,
+            description=entry.description,
+            stats=entry.stats,
+            for_everyone=entry.for_everyone,
+            editable=has_global_perm if entry.for_everyone else True,
+        ) for entry in entries])
+        response = JsonResponse(data)
+        if etag is None:
+            etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+            response = get_conditional_response(request, etag=etag, response=response)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ExportFilterQueryView(LoginRequiredMixin, View):
+    """
+    Stream all items matched by a filter query as csv.
+    """
+    @setup_filterclass
+    @can_view_related_model
+    def get(self, request, **kwargs):
+        try:
+            manager = FilterQuery.objects.db_manager(get_filter_query_database(request))
+            query = manager.get(pk=kwargs['pk'], content_type=self.content_type_obj)
+        except FilterQuery.DoesNotExist:
+            raise Http404
+        if not query.for_everyone and query.user_id != request.user.pk:
+            raise PermissionDenied
+
+        # export only the rows the changelist shows to the user
+        model = self.content_type_obj.model_class()
+        model_admin = get_model_admin(model)
+        if model_admin is None:
+            raise Http404
+        database = get_read_database(request, model, query)
+        queryset = filter_query_queryset(query, database, model_admin.get_queryset(request))
+        response = StreamingHttpResponse(iter_csv(queryset), content_type='text/csv')
+        filename = '{}.csv'.format(slugify(query.name) or query.pk)
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+        return response
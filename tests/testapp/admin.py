@@ -2,11 +2,12 @@
 
 from django.contrib import admin
 from django_admin_filter.filters import CustomFilter
+from django_admin_filter.paginator import KeysetPaginationMixin
 from .models import ModelA
-from .filters import ModelAFilter
 
 
 @admin.register(ModelA)
-class ModelAAdmin(admin.ModelAdmin):
+class ModelAAdmin(KeysetPaginationMixin, admin.ModelAdmin):
     list_display = [f.name for f in ModelA._meta.get_fields()]
     list_filter = [CustomFilter] + [f.name for f in ModelA._meta.get_fields()]
+    filterset_class = 'testapp.filters.ModelAFilter'
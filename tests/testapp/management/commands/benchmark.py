@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import random
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+from django.urls import reverse
+
+from django_admin_filter import settings as app_settings
+from django_admin_filter.filters import get_sidebar_entries
+from django_admin_filter.models import FilterQuery
+from ...models import FIELDS
+from ...models import ModelA
+from .benchmark_indexes import create_filterqueries
+
+User = get_user_model()
+
+# the decimal field allows values below 1000 only
+MAX_VALUE = 5000
+
+
+def create_modela(count, seed=0, batch_size=10000):
+    """
+    Bulk-create ModelA items with random values for all FIELDS.
+    """
+    rnd = random.Random(seed)
+    fields = [f for f in FIELDS if not ModelA._meta.get_field(f).primary_key]
+    batch = list()
+    for i in range(count):
+        batch.append(ModelA(**dict(
+            (f, FIELDS[f]['value'](rnd.randrange(MAX_VALUE))) for f in fields)))
+        if len(batch) == batch_size:
+            ModelA.objects.bulk_create(batch)
+            batch = list()
+    ModelA.objects.bulk_create(batch)
+
+
+def random_querydict(rnd):
+    """
+    A querydict using some random filters of FIELDS.
+    """
+    querydict = dict()
+    for field in rnd.sample(sorted(FIELDS), 3):
+        lookup, value = rnd.choice(sorted(FIELDS[field]['filters'].items()))
+        param = field if lookup == 'exact' else '{}__{}'.format(field, lookup)
+        querydict[param] = value(rnd.randrange(1, 10))
+    return querydict
+
+
+class QueryCounter:
+    """
+    Count the queries executed on a connection. Unlike CaptureQueriesContext
+    this also works for requests, since their queries log is reset on each
+    request.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func, repeat):
+    """
+    Run func repeatedly and return timings, query count and peak memory. The
+    memory is traced within an extra run, since tracing slows down the
+    execution considerably.
+    """
+    timings = list()
+    for i in range(repeat):
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timings.sort()
+    return dict(
+        median_ms=round(timings[len(timings) // 2] * 1000, 3),
+        p95_ms=round(timings[math.ceil(len(timings) * 0.95) - 1] * 1000, 3),
+        min_ms=round(timings[0] * 1000, 3),
+        queries=queries.count,
+        peak_kb=round(peak / 1024, 1),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the custom filter, filter queries and views on generated data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--rows', type=int, default=100000,
+            help='Number of ModelA items to create (default: 100000).')
+        parser.add_argument('-f', '--filterqueries', type=int, default=20000,
+            help='Number of filter queries to create (default: 20000).')
+        parser.add_argument('-u', '--users', type=int, default=100,
+            help='Number of users to spread the filter queries over (default: 100).')
+        parser.add_argument('-s', '--seed', type=int, default=0,
+            help='Seed of the random data generator.')
+        parser.add_argument('--repeat', type=int, default=10,
+            help='Number of runs of each benchmark (default: 10).')
+        parser.add_argument('-o', '--output',
+            help='Write the results as json to this file.')
+        parser.add_argument('-c', '--compare',
+            help='Compare the results with those of a json file of a previous run.')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        setup_test_environment()
+        try:
+            results = self.run(options)
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), results)
+
+    def run(self, options):
+        rnd = random.Random(options['seed'])
+        results = dict(
+            meta=dict(
+                rows=options['rows'],
+                filterqueries=options['filterqueries'],
+                users=options['users'],
+                seed=options['seed'],
+                repeat=options['repeat'],
+                vendor=connection.vendor,
+                django=django.get_version(),
+            ),
+            generate=dict(),
+            benchmarks=dict(),
+        )
+
+        start = time.perf_counter()
+        create_modela(options['rows'], options['seed'])
+        results['generate']['modela_s'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        create_filterqueries(options['filterqueries'], options['users'], options['seed'])
+        results['generate']['filterqueries_s'] = round(time.perf_counter() - start, 3)
+
+        user = User.objects.create_superuser('bench-admin', 'bench@testapp.org', 'bench')
+        content_type = ContentType.objects.get_for_model(ModelA)
+        query = FilterQuery.objects.create(
+            user=user, content_type=content_type, persistent=True,
+            querydict=random_querydict(rnd))
+        url = reverse('admin:testapp_modela_changelist')
+        fq_url = '{}{}'.format(url, app_settings.URL_PATH)
+        client = Client()
+        client.force_login(user)
+
+        def changelist():
+            client.get(url, dict(filter_id=query.id))
+
+        def lookups():
+            get_sidebar_entries(user, ModelA)
+
+        def save():
+            FilterQuery(
+                user=user, content_type=content_type,
+                querydict=random_querydict(rnd)).save()
+
+        def create_view():
+            client.post(fq_url, dict(random_querydict(rnd), apply=True))
+
+        def update_view():
+            client.post('{}{}/'.format(fq_url, query.id), dict(query.querydict, save=True))
+
+        benchmarks = results['benchmarks']
+        for func in (changelist, lookups, save, create_view, update_view):
+            self.stderr.write('Running {}...'.format(func.__name__))
+            benchmarks[func.__name__] = measure(func, options['repeat'])
+        return results
+
+    def compare(self, baseline, results):
+        self.stdout.write('\n{:<16}{:>14}{:>14}{:>10}{:>10}{:>12}'.format(
+            'benchmark', 'median (ms)', 'baseline', 'change', 'queries', 'baseline'))
+        for name, result in results['benchmarks'].items():
+            base = baseline['benchmarks'].get(name)
+            if not base:
+                continue
+            change = (result['median_ms'] - base['median_ms']) / base['median_ms'] * 100
+            self.stdout.write('{:<16}{:>14.3f}{:>14.3f}{:>+9.1f}%{:>10}{:>12}'.format(
+                name, result['median_ms'], base['median_ms'], change,
+                result['queries'], base['queries']))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Max
+from django.db.models import Min
+from django.utils import timezone
+
+from django_admin_filter import settings as app_settings
+from django_admin_filter.filters import sidebar_queryset
+from django_admin_filter.models import FilterQuery
+from ...models import ModelA
+
+User = get_user_model()
+INDEXES = ['fq_personal_idx', 'fq_global_idx']
+
+
+def create_filterqueries(count, users, seed=0, batch_size=10000):
+    """
+    Bulk-create filter queries for all content-types spread over some users.
+    About 5% of them are persistent and 1% are global.
+    """
+    rnd = random.Random(seed)
+    User.objects.bulk_create([
+        User(username='bench-user-{}'.format(i)) for i in range(users)])
+    user_ids = list(User.objects.filter(username__startswith='bench-user-').values_list('id', flat=True))
+    ct_ids = list(ContentType.objects.values_list('id', flat=True))
+    now = timezone.now()
+    batch = list()
+    for i in range(count):
+        persistent = rnd.random() < 0.05
+        batch.append(FilterQuery(
+            name='Filter {}'.format(i),
+            description='auto = {}'.format(i),
+            querydict=dict(auto=i),
+            persistent=persistent,
+            for_everyone=persistent and rnd.random() < 0.2,
+            content_type_id=rnd.choice(ct_ids),
+            user_id=rnd.choice(user_ids),
+        ))
+        if len(batch) == batch_size:
+            FilterQuery.objects.bulk_create(batch)
+            batch = list()
+    FilterQuery.objects.bulk_create(batch)
+    # spread the creation time since auto_now_add gives all rows the same time
+    pks = FilterQuery.objects.aggregate(Min('pk'), Max('pk'))
+    for pk in range(pks['pk__min'] or 0, (pks['pk__max'] or 0) + 1, 100):
+        FilterQuery.objects.filter(pk__gte=pk, pk__lt=pk + 100).update(
+            created=now - timedelta(minutes=rnd.randint(0, 10 ** 6)))
+    return user_ids
+
+
+def get_queries(user_id):
+    """
+    The queries of the sidebar and the history truncation.
+    """
+    user = User.objects.get(pk=user_id)
+    content_type = ContentType.objects.get_for_model(ModelA)
+    history = FilterQuery.objects.filter(
+        user=user,
+        content_type=content_type,
+        persistent=False
+    )[app_settings.HISTORY_LIMIT:]
+    return dict(
+        sidebar=sidebar_queryset(user, ModelA),
+        history_truncation=history.values_list('id', flat=True),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compare query plans and timings of FilterQuery queries with and without indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--rows', type=int, default=200000,
+            help='Number of filter queries to create (default: 200000).')
+        parser.add_argument('-u', '--users', type=int, default=100,
+            help='Number of users to spread the filter queries over (default: 100).')
+        parser.add_argument('-s', '--seed', type=int, default=0,
+            help='Seed of the random data generator.')
+        parser.add_argument('--repeat', type=int, default=20,
+            help='Number of runs for each query timing (default: 20).')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        self.stdout.write('Creating {rows} filter queries...'.format(**options))
+        user_ids = create_filterqueries(options['rows'], options['users'], options['seed'])
+        ContentType.objects.get_for_model(ModelA)
+        indexes = [i for i in FilterQuery._meta.indexes if i.name in INDEXES]
+
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                schema_editor.remove_index(FilterQuery, index)
+        self.analyze()
+        self.report('without indexes', user_ids[0], options['repeat'])
+
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                schema_editor.add_index(FilterQuery, index)
+        self.analyze()
+        self.report('with indexes', user_ids[0], options['repeat'])
+
+    def analyze(self):
+        table = connection.ops.quote_name(FilterQuery._meta.db_table)
+        statement = 'ANALYZE TABLE {}' if connection.vendor == 'mysql' else 'ANALYZE {}'
+        with connection.cursor() as cursor:
+            cursor.execute(statement.format(table))
+
+    def report(self, title, user_id, repeat):
+        self.stdout.write('\n=== {}'.format(title))
+        for name, queryset in get_queries(user_id).items():
+            timings = list()
+            for i in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            self.stdout.write('\n--- {} (median: {:.3f} ms)'.format(name, timings[len(timings) // 2] * 1000))
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db import OperationalError
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+from django.urls import reverse
+
+from django_admin_filter import settings as app_settings
+from django_admin_filter.models import FilterQuery
+from ...models import ModelA
+from .benchmark import QueryCounter
+from .benchmark import create_modela
+from .benchmark import random_querydict
+from .benchmark_indexes import create_filterqueries
+
+User = get_user_model()
+OPERATIONS = ['changelist', 'apply', 'save', 'delete']
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    # nearest-rank percentile
+    values = sorted(values)
+    index = max(math.ceil(len(values) * percent / 100.0) - 1, 0)
+    return round(values[index] * 1000, 3)
+
+
+class WriteTimer:
+    """
+    Time the write statements of a connection. On SQLite a write has to wait
+    for the database lock, so slow writes indicate lock waits.
+    """
+    def __init__(self):
+        self.timings = list()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings.append(time.perf_counter() - start)
+
+
+class Worker(threading.Thread):
+    """
+    Simulate an admin user sending a random mix of requests.
+    """
+    def __init__(self, client, query_ids, options, seed):
+        super().__init__()
+        self.client = client
+        self.query_ids = query_ids
+        self.options = options
+        self.rnd = random.Random(seed)
+        self.own_ids = list()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.writes = WriteTimer()
+        self.url = reverse('admin:testapp_modela_changelist')
+        self.fq_url = '{}{}'.format(self.url, app_settings.URL_PATH)
+
+    def run(self):
+        weights = [self.options[op] for op in OPERATIONS]
+        deadline = time.monotonic() + self.options['duration']
+        try:
+            while time.monotonic() < deadline:
+                operation = self.rnd.choices(OPERATIONS, weights)[0]
+                self.request(operation)
+        finally:
+            connection.close()
+
+    def request(self, operation):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries), connection.execute_wrapper(self.writes):
+                response = getattr(self, operation)()
+        except OperationalError as exc:
+            self.errors[operation] += 1
+            if 'locked' in str(exc):
+                self.locked[operation] += 1
+            return
+        except Exception:
+            self.errors[operation] += 1
+            return
+        # nothing to delete yet
+        if response is None:
+            return
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.queries[operation] += queries.count
+        if response.status_code >= 400:
+            self.errors[operation] += 1
+
+    def changelist(self):
+        return self.client.get(self.url, dict(filter_id=self.rnd.choice(self.query_ids)))
+
+    def apply(self):
+        return self.client.post(self.fq_url, dict(random_querydict(self.rnd), apply=True))
+
+    def save(self):
+        response = self.client.post(self.fq_url, dict(random_querydict(self.rnd), save=True))
+        if response.status_code == 302:
+            self.own_ids.append(int(response.url.rsplit('=', 1)[1]))
+        return response
+
+    def delete(self):
+        if not self.own_ids:
+            return None
+        pk = self.own_ids.pop(self.rnd.randrange(len(self.own_ids)))
+        return self.client.delete('{}{}/'.format(self.fq_url, pk))
+
+
+class Command(BaseCommand):
+    help = 'Replay concurrent filter requests of many users against the testapp.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-t', '--threads', type=int, default=8,
+            help='Number of concurrent users (default: 8).')
+        parser.add_argument('-d', '--duration', type=float, default=10,
+            help='Seconds to run the load test (default: 10).')
+        parser.add_argument('-r', '--rows', type=int, default=10000,
+            help='Number of ModelA items to create (default: 10000).')
+        parser.add_argument('-f', '--filterqueries', type=int, default=10000,
+            help='Number of filter queries to create (default: 10000).')
+        parser.add_argument('-s', '--seed', type=int, default=0,
+            help='Seed of the random data generator.')
+        for operation, weight in zip(OPERATIONS, [60, 20, 10, 10]):
+            parser.add_argument('--{}'.format(operation), type=int, default=weight,
+                help='Weight of {} requests (default: {}).'.format(operation, weight))
+        parser.add_argument('-o', '--output',
+            help='Write the results as json to this file.')
+
+    def handle(self, *args, **options):
+        # Threads need a file-backed database to share the data.
+        tmpdir = None
+        if connection.vendor == 'sqlite':
+            tmpdir = tempfile.mkdtemp()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        setup_test_environment()
+        try:
+            results = self.run(options)
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmpdir:
+                os.rmdir(tmpdir)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        self.stderr.write('Creating test data...')
+        create_modela(options['rows'], options['seed'])
+        create_filterqueries(options['filterqueries'], 100, options['seed'])
+        content_type = ContentType.objects.get_for_model(ModelA)
+        query_ids = list(FilterQuery.objects.filter(
+            content_type=content_type, persistent=True).values_list('id', flat=True))
+
+        workers = list()
+        for i in range(options['threads']):
+            user = User.objects.create_superuser('load-user-{}'.format(i), '', 'load')
+            client = Client()
+            client.force_login(user)
+            workers.append(Worker(client, query_ids, options, options['seed'] + i))
+
+        self.stderr.write('Running {threads} threads for {duration}s...'.format(**options))
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        operations = dict()
+        total = 0
+        for operation in OPERATIONS:
+            latencies = sum((w.latencies[operation] for w in workers), [])
+            total += len(latencies)
+            operations[operation] = dict(
+                requests=len(latencies),
+                errors=sum(w.errors[operation] for w in workers),
+                locked=sum(w.locked[operation] for w in workers),
+                queries_per_request=round(
+                    sum(w.queries[operation] for w in workers) / len(latencies), 2) if latencies else None,
+                p50_ms=percentile(latencies, 50),
+                p95_ms=percentile(latencies, 95),
+                p99_ms=percentile(latencies, 99),
+            )
+        writes = sum((w.writes.timings for w in workers), [])
+        return dict(
+            meta=dict(
+                threads=options['threads'],
+                duration=options['duration'],
+                rows=options['rows'],
+                filterqueries=options['filterqueries'],
+                vendor=connection.vendor,
+                history_mode=app_settings.HISTORY_MODE,
+                history_backend=app_settings.HISTORY_BACKEND,
+            ),
+            requests=total,
+            throughput_rps=round(total / elapsed, 2),
+            operations=operations,
+            writes=dict(
+                statements=len(writes),
+                p50_ms=percentile(writes, 50),
+                p95_ms=percentile(writes, 95),
+                p99_ms=percentile(writes, 99),
+            ),
+        )
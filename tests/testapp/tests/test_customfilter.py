@@ -1,19 +1,55 @@
 
 import re
+import csv
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
 
 from django.test import TestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.test import Client
 from django.urls import reverse
+from django.urls import path
+from django.urls import include
+from django.contrib import admin
 from django.conf import settings
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.utils import timezone
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import Permission
 
 from django_admin_filter import apps
 from django_admin_filter import settings as app_settings
+from django_admin_filter.cache import plan_cache
+from django_admin_filter.cache import usage_cache
+from django_admin_filter import counts
+from django_admin_filter.results import PKRanges
+from django_admin_filter.paginator import KeysetPaginator
+from django_admin_filter.results import result_cache
+from django_admin_filter.stats import stats_buffer
+from django_admin_filter.plans import captured
 from django_admin_filter.filters import CustomFilter
+from django_admin_filter.filters import apply_filter_query
+from django_admin_filter.filters import get_sidebar_entries
+from django_admin_filter.filterset import AdminFilterSet
+from django_admin_filter.filterset import deferred_filtersets
+from django_admin_filter.history import DatabaseHistory
+from django_admin_filter.history import get_history_backend
 from django_admin_filter.models import FilterQuery
+from django_admin_filter.models import hash_querydict
+from django_admin_filter.models import FilterQueryPlan
+from django_admin_filter.replicas import PIN_SESSION_KEY
+from django_admin_filter.routers import FilterQueryRouter
+from django_admin_filter.replicas import get_read_database
 
+from ..filters import ModelAFilter
 from ..models import ModelA
 from ..models import UNICODE_STRING
 from ..models import FIELDS
@@ -36,6 +72,13 @@ class AlterAppSettings:
             setattr(app_settings, setting, value)
 
 
+class AsyncUrls:
+    urlpatterns = [
+        path('admin/', include('django_admin_filter.async_urls')),
+        path('admin/', admin.site.urls),
+    ]
+
+
 class AddPermission:
     def __init__(self, user, perm):
         self.user = user
@@ -49,6 +92,8 @@ class AddPermission:
 
 
 class FilterViewTest(TestCase):
+    databases = {'default', 'filters'}
+
     @classmethod
     def setUpTestData(cls):
         create_test_data()
@@ -244,7 +289,7 @@ class FilterViewTest(TestCase):
             self.assertIn(fq.description, content)
             self.assertIn('?filter_id={}'.format(fq.id), content)
             # edit and delete links shouldn't be rendered
-            self.assertNotIn('{}{}/'.format(app_settings.URL_PATH, fq.id), content)
+            self.assertNotIn('href="{}{}/"'.format(app_settings.URL_PATH, fq.id), content)
 
         # give user permission and do it again
         with AddPermission(self.anyuser, self.permission):
@@ -256,7 +301,7 @@ class FilterViewTest(TestCase):
                 self.assertIn(fq.description, content)
                 self.assertIn('?filter_id={}'.format(fq.id), content)
                 # edit and delete links should be rendered now
-                self.assertIn('{}{}/'.format(app_settings.URL_PATH, fq.id), content)
+                self.assertIn('href="{}{}/"'.format(app_settings.URL_PATH, fq.id), content)
 
     def test_07_valid_content_type_header_in_request(self):
         self.client.force_login(self.admin)
@@ -264,3 +309,824 @@ class FilterViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response['content-type'].startswith('text/html'))
 
+
+    def test_08_plan_cache(self):
+        plan_cache.clear()
+        fq = FilterQuery.objects.create(**self.fq_params, querydict=self.querydict)
+        expected = list(ModelAFilter(self.querydict, ModelA.objects.all()).qs)
+
+        # the first run compiles and caches the plan
+        queryset = apply_filter_query(fq, ModelA.objects.all(), ModelAFilter)
+        self.assertEqual(list(queryset), expected)
+        self.assertIsNotNone(plan_cache.get(fq.id))
+
+        # the second run replays the cached plan
+        queryset = apply_filter_query(fq, ModelA.objects.all(), ModelAFilter)
+        self.assertEqual(list(queryset), expected)
+
+        # plans are shared through the django cache if configured
+        with AlterAppSettings(CACHE='default'):
+            plan_cache.set(fq.id, plan_cache.get(fq.id))
+            plan_cache.local.clear()
+            self.assertIsNotNone(plan_cache.get(fq.id))
+            queryset = apply_filter_query(fq, ModelA.objects.all(), ModelAFilter)
+            self.assertEqual(list(queryset), expected)
+            plan_cache.delete(fq.id)
+
+        # the changelist uses the cached plan as well
+        self.client.force_login(self.admin)
+        response = self.client.get('{}?filter_id={}'.format(self.url, fq.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].queryset), expected)
+
+        # saving and deleting the filter-query invalidates the plan
+        fq.querydict = dict(auto=1)
+        fq.save()
+        self.assertIsNone(plan_cache.get(fq.id))
+        queryset = apply_filter_query(fq, ModelA.objects.all(), ModelAFilter)
+        self.assertEqual(list(queryset), list(ModelA.objects.filter(auto=1)))
+        fq_id = fq.id
+        fq.delete()
+        self.assertIsNone(plan_cache.get(fq_id))
+
+    def test_09_sidebar_entries(self):
+        with self.assertNumQueries(1):
+            entries = get_sidebar_entries(self.admin, ModelA)
+        ids = [e.id for e in entries]
+        persistents = FilterQuery.objects.filter(persistent=True, content_type__model='modela')
+        persistents = persistents.filter(user=self.admin) | persistents.filter(for_everyone=True)
+        history = self.history.all()[:app_settings.HISTORY_LIMIT]
+        self.assertEqual(set(ids), set(f.id for f in persistents) | set(f.id for f in history))
+
+        # the current query is resolved from the sidebar entries
+        self.client.force_login(self.admin)
+        response = self.client.get('{}?filter_id={}'.format(self.url, ids[0]))
+        spec = response.context['cl'].filter_specs[0]
+        self.assertEqual(spec.current_query.id, ids[0])
+
+        # entries are cached until a filter query changes
+        with AlterAppSettings(CACHE='default'):
+            get_sidebar_entries(self.admin, ModelA)
+            with self.assertNumQueries(0):
+                self.assertEqual(get_sidebar_entries(self.admin, ModelA), entries)
+            FilterQuery.objects.create(**self.fq_params, persistent=True)
+            with self.assertNumQueries(1):
+                self.assertEqual(len(get_sidebar_entries(self.admin, ModelA)), len(entries) + 1)
+
+    def test_10_history_deduplication(self):
+        self.client.force_login(self.admin)
+        querydict = dict(auto='3', integer__lt='5')
+        post_data = dict(querydict, apply=True)
+        history = self.history.filter(querydict_hash=hash_querydict(querydict))
+        response = self.client.post(self.fq_url, data=post_data)
+        self.assertEqual(response.status_code, 302)
+        fq = history.get()
+
+        # applying the same querydict again touches the existing entry
+        post_data = dict(reversed(list(querydict.items())), apply=True)
+        response = self.client.post(self.fq_url, data=post_data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '{}?filter_id={}'.format(self.url, fq.id))
+        self.assertEqual(history.count(), 1)
+        self.assertGreaterEqual(history.get().created, fq.created)
+        self.assertEqual(FilterQuery.objects.latest('created').id, fq.id)
+
+    def test_11_history_ring_buffer(self):
+        with AlterAppSettings(HISTORY_MODE='ring', HISTORY_LIMIT=3):
+            self.history.delete()
+            for i in range(3):
+                FilterQuery(**self.fq_params, querydict=dict(auto=i)).save()
+            self.assertEqual(set(self.history.values_list('slot', flat=True)), {0, 1, 2})
+            oldest = self.history.order_by('created').first()
+            old = timezone.now() - timedelta(days=10)
+            FilterQuery.objects.filter(id=oldest.id).update(
+                run_count=5, sample_count=2, mean_time=1, p95_time=2,
+                last_row_count=7, last_run=old, last_used=old)
+            FilterQueryPlan.objects.create(filter_query=oldest, vendor='sqlite', plan='SCAN')
+            stats_buffer.record(oldest.id, 1, 7)
+
+            # a full history overwrites the oldest slot with a single update
+            # and drops the plans of the overwritten entry
+            with CaptureQueriesContext(connection) as context:
+                fq = FilterQuery(**self.fq_params, querydict=dict(auto=3))
+                fq.save()
+            writes = [q['sql'].split()[0] for q in context.captured_queries
+                      if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+            self.assertEqual(writes, ['UPDATE', 'DELETE'])
+            self.assertEqual((fq.id, fq.slot), (oldest.id, oldest.slot))
+
+            # the overwritten entry has no stats of its predecessor
+            stats_buffer.flush()
+            fq.refresh_from_db()
+            self.assertEqual((fq.run_count, fq.sample_count), (0, 0))
+            self.assertEqual((fq.mean_time, fq.p95_time, fq.last_row_count, fq.last_run),
+                             (None, None, None, None))
+            self.assertGreater(fq.last_used, old)
+            self.assertFalse(fq.plans.exists())
+            self.assertEqual(self.history.count(), 3)
+            self.assertEqual(
+                sorted(f.querydict['auto'] for f in self.history.all()), [1, 2, 3])
+
+            # saving a history entry as persistent filter releases its slot
+            fq.persistent = True
+            fq.save()
+            self.assertIsNone(fq.slot)
+            FilterQuery(**self.fq_params, querydict=dict(auto=4)).save()
+            self.assertEqual(set(self.history.values_list('slot', flat=True)), {0, 1, 2})
+
+    def test_12_purge_filterqueries(self):
+        old = timezone.now() - timedelta(days=10)
+        for i in range(5):
+            FilterQuery.objects.create(**self.fq_params, querydict=dict(auto=i))
+        expired = list(self.history.values_list('id', flat=True)[:2])
+        FilterQuery.objects.filter(id__in=expired).update(created=old)
+        unused = self.persistents.first()
+        FilterQuery.objects.filter(id=unused.id).update(created=old, last_used=old)
+        used = self.persistents.exclude(id=unused.id).first()
+        FilterQuery.objects.filter(id=used.id).update(created=old, last_used=timezone.now())
+        # e.g. saved before last_used was tracked
+        unknown = self.persistents.exclude(id__in=[unused.id, used.id]).first()
+        FilterQuery.objects.filter(id=unknown.id).update(created=old, last_used=None)
+
+        # a dry run deletes nothing
+        out = StringIO()
+        count = FilterQuery.objects.count()
+        call_command('purge_filterqueries', history_ttl=5, unused_ttl=5, dry_run=True, stdout=out)
+        self.assertIn('expired history entries: 2 rows would be deleted', out.getvalue())
+        self.assertEqual(FilterQuery.objects.count(), count)
+
+        out = StringIO()
+        call_command('purge_filterqueries', history_ttl=5, unused_ttl=5, chunk_size=1, stdout=out)
+        self.assertIn('expired history entries: 2 rows deleted', out.getvalue())
+        self.assertFalse(FilterQuery.objects.filter(id__in=expired + [unused.id]).exists())
+        self.assertTrue(FilterQuery.objects.filter(id=used.id).exists())
+        self.assertTrue(FilterQuery.objects.filter(id=unknown.id).exists())
+
+        # truncate the history offline
+        with AlterAppSettings(HISTORY_LIMIT=1, TRUNCATE_HISTORY=False):
+            FilterQuery.objects.create(**self.fq_params)
+            FilterQuery.objects.create(**self.fq_params)
+            call_command('purge_filterqueries', truncate=True, chunk_size=2, stdout=StringIO())
+            self.assertEqual(self.history.count(), 1)
+
+    def test_13_touch_last_used(self):
+        usage_cache.clear()
+        self.client.force_login(self.admin)
+        fq = self.persistents.first()
+        # saved filters count as used when created
+        self.assertIsNotNone(fq.last_used)
+        FilterQuery.objects.filter(pk=fq.pk).update(last_used=None)
+        self.client.get('{}?filter_id={}'.format(self.url, fq.id))
+        fq.refresh_from_db()
+        self.assertIsNotNone(fq.last_used)
+
+    def test_14_result_cache(self):
+        ranges = PKRanges.from_pks([1, 2, 3, 5, 7, 8])
+        self.assertEqual(list(ranges), [(1, 3), (5, 5), (7, 8)])
+        self.assertEqual(ranges.count, 6)
+        self.assertIsNone(PKRanges.from_pks([1, 3, 5], max_ranges=2))
+
+        result_cache.clear()
+        querydict = dict(auto__in='2,3,4,6')
+        fq = FilterQuery.objects.create(**self.fq_params, querydict=querydict, persistent=True)
+        expected = list(ModelA.objects.filter(auto__in=[2, 3, 4, 6]).order_by('pk'))
+        # results are not cached without a shared cache
+        with AlterAppSettings(RESULT_CACHE=True), self.assertNumQueries(0):
+            queryset = apply_filter_query(fq, ModelA.objects.order_by('pk'), ModelAFilter)
+            self.assertNotIn('BETWEEN', str(queryset.query))
+
+        with AlterAppSettings(RESULT_CACHE=True, CACHE='default'):
+            queryset = apply_filter_query(fq, ModelA.objects.order_by('pk'), ModelAFilter)
+            self.assertEqual(list(queryset), expected)
+            self.assertIn('BETWEEN', str(queryset.query))
+            with self.assertNumQueries(1):
+                queryset = apply_filter_query(fq, ModelA.objects.order_by('pk'), ModelAFilter)
+                self.assertEqual(list(queryset), expected)
+
+            # changes of the filtered model invalidate the cached results
+            ModelA.objects.get(auto=3).delete()
+            queryset = apply_filter_query(fq, ModelA.objects.all(), ModelAFilter)
+            self.assertEqual(len(queryset), 3)
+
+    def test_15_count_cache_and_estimates(self):
+        queryset = ModelA.objects.filter(auto__lt=5)
+        # counts are not cached without a shared cache
+        with AlterAppSettings(COUNT_CACHE_TIMEOUT=60), self.assertNumQueries(2):
+            counts.count_queryset(queryset)
+            counts.count_queryset(queryset)
+
+        with AlterAppSettings(COUNT_CACHE_TIMEOUT=60, CACHE='default'):
+            with self.assertNumQueries(1):
+                self.assertEqual(counts.count_queryset(queryset), 4)
+                self.assertEqual(counts.count_queryset(queryset), 4)
+            # changes of the model invalidate cached counts
+            ModelA.objects.get(auto=1).delete()
+            self.assertEqual(counts.count_queryset(queryset), 3)
+            # even if the filterset declared by path was not imported yet
+            others = ModelA.objects.filter(auto__gte=5)
+            count = counts.count_queryset(others)
+            with mock.patch.dict(AdminFilterSet._REGISTRY, clear=True):
+                ModelA.objects.get(auto=5).delete()
+            self.assertEqual(counts.count_queryset(others), count - 1)
+
+        # the estimate is used above the threshold only
+        estimator = mock.Mock(return_value=1000)
+        with mock.patch.dict(counts.ESTIMATORS, sqlite=estimator):
+            with AlterAppSettings(ESTIMATE_COUNT_THRESHOLD=999):
+                count = counts.count_queryset(queryset)
+                self.assertTrue(count.estimated)
+                self.assertEqual(count, 1000)
+
+                # the changelist marks estimated counts
+                self.client.force_login(self.admin)
+                fq = FilterQuery.objects.create(querydict=dict(auto__gt='2'), persistent=True, **self.fq_params)
+                response = self.client.get('{}?filter_id={}'.format(self.url, fq.id))
+                content = response.content.decode('utf-8')
+                self.assertIn('~1000 estimated', content)
+                self.assertIn('~1000</span>', content)
+
+            with AlterAppSettings(ESTIMATE_COUNT_THRESHOLD=1000):
+                count = counts.count_queryset(queryset)
+                self.assertFalse(hasattr(count, 'estimated'))
+                self.assertEqual(count, 3)
+
+    def test_16_execution_stats(self):
+        self.client.force_login(self.admin)
+        fq = self.persistents.first()
+        url = '{}?filter_id={}'.format(self.url, fq.id)
+        rows = ModelAFilter(fq.querydict, ModelA.objects.all()).qs.count()
+        with AlterAppSettings(STATS=True, STATS_SAMPLE_RATE=1, STATS_FLUSH_SIZE=3):
+            # stats are only written once the buffer is flushed
+            self.client.get(url)
+            self.client.get(url)
+            fq.refresh_from_db()
+            self.assertEqual(fq.run_count, 0)
+            self.assertEqual(len(stats_buffer), 1)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+            self.assertEqual(len(updates), 1)
+            self.assertEqual(len(stats_buffer), 0)
+
+            fq.refresh_from_db()
+            self.assertEqual(fq.run_count, 3)
+            self.assertEqual(fq.sample_count, 3)
+            self.assertEqual(fq.last_row_count, rows)
+            self.assertGreater(fq.mean_time, 0)
+            self.assertGreaterEqual(fq.p95_time, 0)
+            self.assertIsNotNone(fq.last_used)
+
+            # further batches are merged with the stored stats
+            for i in range(3):
+                self.client.get(url)
+            fq.refresh_from_db()
+            self.assertEqual(fq.run_count, 6)
+            response = self.client.get(url)
+            self.assertIn('6 runs', response.content.decode('utf-8'))
+            stats_buffer.flush()
+
+        # timing a run needs no extra query
+        with AlterAppSettings(STATS=True, STATS_SAMPLE_RATE=0):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as untimed:
+                self.client.get(url)
+            with AlterAppSettings(STATS_SAMPLE_RATE=1), CaptureQueriesContext(connection) as timed:
+                self.client.get(url)
+            self.assertEqual(len(timed), len(untimed))
+            self.assertFalse(connection.execute_wrappers)
+            stats_buffer.flush()
+            fq.refresh_from_db()
+            self.assertEqual(fq.run_count, 10)
+            self.assertEqual(fq.sample_count, 8)
+            self.assertEqual(fq.last_row_count, rows)
+
+    def test_17_query_plans(self):
+        captured.clear()
+        self.client.force_login(self.admin)
+        fq = self.persistents.first()
+        fq.querydict = dict(char__contains=UNICODE_STRING[1])
+        fq.save()
+        url = '{}?filter_id={}'.format(self.url, fq.id)
+        with AlterAppSettings(SLOW_FILTER_THRESHOLD=0, STATS_SAMPLE_RATE=1, PLAN_SEQ_SCAN_ROWS=1):
+            # plans of slow filters are captured once per interval
+            self.client.get(url)
+            self.client.get(url)
+            plan = FilterQueryPlan.objects.get(filter_query=fq)
+            self.assertEqual(plan.querydict_hash, fq.querydict_hash)
+            self.assertEqual(plan.vendor, connection.vendor)
+            self.assertIsNotNone(plan.duration)
+            self.assertTrue(plan.seq_scan)
+            self.assertFalse(plan.disk_sort)
+
+            out = StringIO()
+            call_command('explain_filterqueries', fq.id, stdout=out)
+            self.assertIn('seq_scan', out.getvalue())
+            self.assertEqual(fq.plans.count(), 2)
+
+        with AlterAppSettings(PLAN_SEQ_SCAN_ROWS=10 ** 6):
+            out = StringIO()
+            call_command('explain_filterqueries', persistent=True, flagged=True, stdout=out)
+            self.assertEqual(out.getvalue(), '')
+            persistents = FilterQuery.objects.filter(persistent=True)
+            self.assertEqual(FilterQueryPlan.objects.filter(seq_scan=False).count(), persistents.count())
+
+    def test_18_content_type_by_id(self):
+        ContentType.objects.get_for_model(ModelA, for_concrete_model=False)
+        with CaptureQueriesContext(connection) as queries:
+            get_sidebar_entries(self.admin, ModelA)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('django_content_type', queries[0]['sql'])
+
+        # content-types of the views are taken from the cache as well
+        self.client.force_login(self.admin)
+        self.client.get(self.fq_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.fq_url)
+        self.assertFalse([q for q in queries if 'django_content_type' in q['sql']])
+
+    def test_19_grouped_choices_and_fragment_cache(self):
+        self.client.force_login(self.anyuser)
+        response = self.client.get(self.url)
+        changelist = response.context['cl']
+        spec = changelist.filter_specs[0]
+        choices = list(spec.choices(changelist))
+        self.assertEqual(choices[0]['display'], 'All')
+        sections = dict((c['section'], c) for c in choices[1:])
+        self.assertEqual(list(sections), ['global_filters', 'personal_filters', 'history'])
+        self.assertFalse(sections['global_filters']['editable'])
+        self.assertTrue(sections['personal_filters']['editable'])
+        self.assertEqual(len(sections['global_filters']['choices']), self.globals.count())
+        self.assertIsNone(spec.fragment_key)
+
+        with AlterAppSettings(CACHE='default'):
+            response = self.client.get(self.url)
+            key = response.context['cl'].filter_specs[0].fragment_key
+            fragment_key = make_template_fragment_key('django_admin_filter_sidebar', [key])
+            self.assertIn(self.globals.first().name, caches['default'].get(fragment_key))
+
+            # the key changes with the permissions and any change of a filter query
+            with AddPermission(self.anyuser, self.permission):
+                response = self.client.get(self.url)
+                self.assertNotEqual(response.context['cl'].filter_specs[0].fragment_key, key)
+            self.globals.first().save()
+            response = self.client.get(self.url)
+            self.assertNotEqual(response.context['cl'].filter_specs[0].fragment_key, key)
+
+    def test_20_sidebar_entries_endpoint(self):
+        self.client.force_login(self.admin)
+        url = '{}entries/'.format(self.fq_url)
+        persistents = FilterQuery.objects.filter(
+            Q(for_everyone=True) | Q(user=self.admin), persistent=True)
+        expected = list(persistents.order_by('-for_everyone', '-created', '-id').values_list('id', flat=True))
+
+        # walk through all pages by cursor
+        ids, cursor = list(), None
+        while True:
+            params = dict(limit=2, cursor=cursor) if cursor else dict(limit=2)
+            data = self.client.get(url, params).json()
+            self.assertLessEqual(len(data['entries']), 2)
+            ids.extend(e['id'] for e in data['entries'])
+            cursor = data['cursor']
+            if not cursor:
+                break
+        self.assertEqual(ids, expected)
+
+        # search by name
+        fq = persistents.first()
+        data = self.client.get(url, dict(q=fq.name)).json()
+        self.assertEqual([e['id'] for e in data['entries']], [fq.id])
+        self.assertEqual(self.client.get(url, dict(cursor='foobar')).status_code, 400)
+
+        # conditional requests
+        for cache in (None, 'default'):
+            with AlterAppSettings(CACHE=cache):
+                response = self.client.get(url)
+                etag = response['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                fq.name += ' changed'
+                fq.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+                # flushed stats are written by update() and change the etag too
+                etag = response['ETag']
+                stats_buffer.record(fq.id, 0.1, 5)
+                stats_buffer.flush()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('5 rows', [e for e in response.json()['entries'] if e['id'] == fq.id][0]['stats'])
+
+    def test_21_sidebar_limit(self):
+        self.client.force_login(self.admin)
+        with AlterAppSettings(SIDEBAR_LIMIT=2):
+            entries = get_sidebar_entries(self.admin, ModelA)
+            self.assertEqual(len([e for e in entries if e.persistent]), 2)
+            self.assertEqual(len([e for e in entries if not e.persistent]), self.history.count())
+            self.assertTrue(entries.cursor)
+            response = self.client.get(self.url)
+            self.assertIn('data-cursor="{}"'.format(entries.cursor), response.content.decode('utf-8'))
+
+            # the endpoint continues with the next entries
+            data = self.client.get('{}entries/'.format(self.fq_url), dict(cursor=entries.cursor)).json()
+            self.assertEqual(len(data['entries']), self.persistents.count() - 2)
+
+    @override_settings(ROOT_URLCONF=AsyncUrls)
+    def test_22_async_views(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.fq_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('id_fq-name', response.content.decode('utf-8'))
+
+        # apply and save filter queries
+        for action in ('apply', 'save'):
+            post_data = dict(self.querydict, **{action: True})
+            response = self.client.post(self.fq_url, data=post_data)
+            self.assertEqual(response.status_code, 302)
+            fq = FilterQuery.objects.latest('created')
+            self.assertEqual(response.url, '{}?filter_id={}'.format(self.url, fq.id))
+            self.assertEqual(fq.persistent, action == 'save')
+
+        # identical history entries are reused
+        count = self.history.count()
+        response = self.client.post(self.fq_url, data=dict(self.querydict, apply=True))
+        self.assertEqual(self.history.count(), count)
+        # by the async ORM API instead of the sync db backend
+        with mock.patch.object(DatabaseHistory, 'add') as add:
+            self.client.post(self.fq_url, data=dict(self.querydict, apply=True))
+        add.assert_not_called()
+        with AlterAppSettings(HISTORY_BACKEND='session'):
+            response = self.client.post(self.fq_url, data=dict(auto__gt=1, apply=True))
+        self.assertTrue(response.url.rsplit('=', 1)[1].startswith('h'))
+        self.assertEqual(self.history.count(), count)
+
+        # update and delete
+        url = '{}{}/'.format(self.fq_url, fq.id)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, data={'fq-name': 'renamed', 'save': True})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(FilterQuery.objects.get(pk=fq.id).name, 'renamed')
+        self.assertEqual(self.client.delete('{}0/'.format(self.fq_url)).status_code, 404)
+
+        self.client.force_login(self.anyuser)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.delete(url).json(), dict(id=fq.id))
+        self.assertFalse(FilterQuery.objects.filter(pk=fq.id).exists())
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.fq_url).status_code, 302)
+
+    def test_23_export_import(self):
+        querydict = {'integer__in': '0,1,2', 'auto__range': '0,5', 'date__range': '1970-01-01,1970-01-05'}
+        FilterQuery.objects.create(name='in and range', querydict=querydict, persistent=True, **self.fq_params)
+        out, err = StringIO(), StringIO()
+        call_command('export_filterqueries', 'testapp.modela', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), FilterQuery.objects.filter(persistent=True).count())
+        expected = sorted(FilterQuery.objects.filter(persistent=True).values_list(
+            'user_id', 'name', 'querydict_hash', 'description', 'for_everyone'))
+
+        # invalid lines are reported and skipped
+        FilterQuery.objects.all().delete()
+        lines += ['{"foo": "bar"}', lines[0].replace('"testapp"', '"nowhere"')]
+        with mock.patch('sys.stdin', StringIO('\n'.join(lines))):
+            call_command('import_filterqueries', '-b', '2', stdout=out, stderr=err)
+        self.assertIn('{} imported, 0 skipped, 2 invalid'.format(len(expected)), out.getvalue())
+        self.assertIn('line {}'.format(len(lines)), err.getvalue())
+        imported = sorted(FilterQuery.objects.values_list(
+            'user_id', 'name', 'querydict_hash', 'description', 'for_everyone'))
+        self.assertEqual(imported, expected)
+        self.assertEqual(FilterQuery.objects.get(name='in and range').querydict, querydict)
+
+        # existing filter queries are skipped
+        with mock.patch('sys.stdin', StringIO('\n'.join(lines[:3]))):
+            call_command('import_filterqueries', stdout=out, stderr=err)
+        self.assertIn('0 imported, 3 skipped', out.getvalue())
+
+    def test_24_export_results(self):
+        fq = self.persistents.first()
+        expected = list(apply_filter_query(fq, ModelA.objects.order_by('pk'), ModelAFilter))
+        url = '{}{}/export/'.format(self.fq_url, fq.id)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], [f.attname for f in ModelA._meta.concrete_fields])
+        self.assertEqual([int(r[0]) for r in rows[1:]], [i.pk for i in expected])
+        self.assertEqual(self.client.get('{}0/export/'.format(self.fq_url)).status_code, 404)
+
+        # personal filter queries of others are not exported
+        personal = FilterQuery.objects.create(querydict=dict(auto__gt='1'), persistent=True, **self.fq_params)
+        shared = FilterQuery.objects.create(
+            querydict=dict(auto__gt='1'), persistent=True, for_everyone=True, **self.fq_params)
+        self.client.force_login(self.anyuser)
+        self.assertEqual(self.client.get('{}{}/export/'.format(self.fq_url, personal.id)).status_code, 403)
+        self.assertEqual(self.client.get('{}{}/export/'.format(self.fq_url, shared.id)).status_code, 200)
+
+        # only the rows of the queryset of the ModelAdmin are exported
+        restricted = ModelA.objects.filter(auto__lte=3)
+        with mock.patch.object(admin.site._registry[ModelA], 'get_queryset', return_value=restricted):
+            response = self.client.get('{}{}/export/'.format(self.fq_url, shared.id))
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual([int(r[0]) for r in rows[1:]], [2, 3])
+
+        out = StringIO()
+        call_command('export_filterquery_results', fq.id, '-f', 'pk', '-c', '2', stdout=out)
+        self.assertEqual(out.getvalue().split(), ['pk'] + [str(i.pk) for i in expected])
+
+    def test_25_keyset_pagination(self):
+        self.client.force_login(self.admin)
+        model_admin = admin.site._registry[ModelA]
+
+        # only the changelists of the paginators use their pagination
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'django_admin_filter/pagination.html')
+        response = self.client.get(reverse('admin:django_admin_filter_filterquery_changelist'))
+        self.assertTemplateNotUsed(response, 'django_admin_filter/pagination.html')
+        self.assertTemplateUsed(response, 'admin/pagination.html')
+
+        def walk(params):
+            pks, pages, statements = list(), 0, list()
+            def log(execute, sql, *args):
+                statements.append(sql)
+                return execute(sql, *args)
+            params = dict(params)
+            while True:
+                with connection.execute_wrapper(log):
+                    response = self.client.get(self.url, params)
+                cl = response.context['cl']
+                pks.extend(o.pk for o in cl.result_list)
+                pages += 1
+                next_cursor = cl.paginator.rows[1]
+                if not next_cursor:
+                    return pks, pages, statements, cl
+                self.assertIn('cursor={}'.format(next_cursor), response.content.decode('utf-8'))
+                params['cursor'] = next_cursor
+
+        with mock.patch.object(model_admin, 'list_per_page', 2):
+            # the changelist ordering is used as keyset
+            for params, ordering in ((dict(), ['-auto']), (dict(o='2.-1'), ['char', '-auto'])):
+                pks, pages, statements, cl = walk(params)
+                self.assertEqual(pks, list(ModelA.objects.order_by(*ordering).values_list('pk', flat=True)))
+                self.assertEqual(pages, 5)
+                self.assertFalse(any('OFFSET' in sql for sql in statements))
+
+            # keyset pagination of a filter query skipping the count
+            fq = FilterQuery.objects.create(querydict=dict(auto__gt='2'), persistent=True, **self.fq_params)
+            expected = list(apply_filter_query(fq, ModelA.objects.order_by('-auto'), ModelAFilter).values_list('pk', flat=True))
+            with AlterAppSettings(KEYSET_SKIP_COUNT=True), \
+                    mock.patch.object(model_admin, 'show_full_result_count', False):
+                pks, pages, statements, cl = walk(dict(filter_id=fq.id))
+            self.assertEqual(pks, expected)
+            self.assertEqual(pages, 4)
+            self.assertTrue(cl.result_count.unknown)
+            self.assertFalse(any('COUNT(' in sql for sql in statements))
+
+            # invalid cursors are handled as invalid page numbers
+            response = self.client.get(self.url, dict(cursor='foobar'))
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('e=1', response.url)
+
+        # cursors keep the microseconds of datetimes
+        start = timezone.now().replace(microsecond=0)
+        for i, obj in enumerate(ModelA.objects.order_by('pk')):
+            ModelA.objects.filter(pk=obj.pk).update(datetime=start + timedelta(microseconds=i % 3))
+        for ordering in (['datetime', '-pk'], ['-datetime', 'pk']):
+            queryset = ModelA.objects.order_by(*ordering)
+            pks, cursor = list(), None
+            # bounded, since a wrong cursor could repeat pages forever
+            for page in range(queryset.count()):
+                paginator = KeysetPaginator(queryset, 2)
+                paginator.cursor = cursor
+                rows, cursor = paginator.rows
+                pks.extend(o.pk for o in rows)
+                if not cursor:
+                    break
+            self.assertEqual(pks, list(queryset.values_list('pk', flat=True)))
+
+    def test_26_filterset_metadata(self):
+        metadata = ModelAFilter.get_metadata()
+        self.assertIs(metadata, ModelAFilter.get_metadata())
+        self.assertEqual(metadata.param_names, set(ModelAFilter().form.fields))
+        self.assertEqual(metadata.filters['char__contains'].lookup_expr, 'contains')
+        self.assertEqual(metadata.extract_querydict(dict(self.querydict, foo='bar', auto='')),
+                         dict((k, v) for k, v in self.querydict.items() if k != 'auto'))
+        self.assertEqual(list(metadata.validate(dict(auto='x', foo='bar'))), ['auto', 'foo'])
+        self.assertEqual(metadata.validate(self.querydict), dict())
+        querydict = {'integer__in': '0,1,2', 'auto__range': '0,5', 'date__range': '1970-01-01,1970-01-05'}
+        self.assertEqual(metadata.validate(querydict), dict())
+        self.assertEqual(list(metadata.validate({'integer__in': '0,x', 'auto__range': '0'})), ['integer__in', 'auto__range'])
+
+        # posting a filter query builds the filterset form just once
+        init = ModelAFilter.__init__
+        calls = list()
+        def counting_init(*args, **kwargs):
+            calls.append(args)
+            init(*args, **kwargs)
+        self.client.force_login(self.admin)
+        with mock.patch.object(ModelAFilter, '__init__', counting_init):
+            response = self.client.post(self.fq_url, data=dict(self.querydict, apply=True))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(FilterQuery.objects.get(pk=response.url.rsplit('=', 1)[1]).querydict.keys(), self.querydict.keys())
+
+    def test_27_lazy_filtersets(self):
+        model_admin = admin.site._registry[ModelA]
+        with mock.patch.dict(AdminFilterSet._REGISTRY, clear=True):
+            # declared by the ModelAdmin
+            self.assertEqual(deferred_filtersets(), {'testapp.ModelA': 'testapp.filters.ModelAFilter'})
+            # the first lookup reports the deferred filtersets
+            with mock.patch.object(AdminFilterSet, '_REPORTED', False), \
+                    self.assertLogs('django_admin_filter.filterset', 'DEBUG') as logs:
+                self.assertIs(AdminFilterSet.by_model(ModelA), ModelAFilter)
+            self.assertIn('testapp.ModelA: testapp.filters.ModelAFilter', logs.output[-1])
+            self.assertEqual(deferred_filtersets(), dict())
+
+        with mock.patch.dict(AdminFilterSet._REGISTRY, clear=True), \
+                mock.patch.object(model_admin, 'filterset_class', None):
+            with self.assertRaises(ImproperlyConfigured):
+                AdminFilterSet.by_model(ModelA)
+            # declared by the setting
+            with AlterAppSettings(FILTERSETS={'testapp.modela': 'testapp.filters.ModelAFilter'}):
+                self.assertIs(AdminFilterSet.by_model(ModelA), ModelAFilter)
+            with AlterAppSettings(FILTERSETS={'testapp.ModelA': 'testapp.filters.Missing'}):
+                AdminFilterSet._REGISTRY.clear()
+                with self.assertRaises(ImproperlyConfigured):
+                    AdminFilterSet.by_model(ModelA)
+
+        # the changelist works with the lazily imported filterset
+        self.client.force_login(self.admin)
+        with mock.patch.dict(AdminFilterSet._REGISTRY, clear=True):
+            response = self.client.get(self.url, dict(filter_id=self.persistents.first().id))
+            self.assertEqual(response.status_code, 200)
+            self.assertIs(AdminFilterSet._REGISTRY[ModelA], ModelAFilter)
+
+    def test_28_facet_counts(self):
+        self.client.force_login(self.admin)
+        FilterQuery.objects.create(querydict=dict(auto__gt='2', char__contains='='), persistent=True, **self.fq_params)
+        persistents = FilterQuery.objects.filter(Q(for_everyone=True) | Q(user=self.admin), persistent=True)
+        expected = dict((fq.id, apply_filter_query(fq, ModelA.objects.all(), ModelAFilter).count()) for fq in persistents)
+        statements = list()
+        def log(execute, sql, *args):
+            statements.append(sql)
+            return execute(sql, *args)
+
+        with AlterAppSettings(FACETS=True):
+            for i in range(2):
+                with connection.execute_wrapper(log):
+                    response = self.client.get(self.url)
+                content = response.content.decode('utf-8')
+                for fq in persistents:
+                    self.assertIn('>{} <small>({})</small></a>'.format(fq.name, expected[fq.id]), content)
+            # all counts by a single aggregate query which is cached
+            facet_queries = [sql for sql in statements if '__c"' in sql]
+            self.assertEqual(len(facet_queries), 1)
+            self.assertNotIn('SELECT', facet_queries[0][1:])
+
+            # the counts by the aggregate match those of the filtersets
+            entries = [e for e in get_sidebar_entries(self.admin, ModelA) if e.persistent]
+            result = ModelA.objects.aggregate(**CustomFilter.get_facet_counts(
+                mock.Mock(lookup_choices=entries, filterset_class=ModelAFilter), 'pk', ModelA.objects.all()))
+            self.assertEqual(dict((e.id, result['{}__c'.format(e.id)]) for e in entries), expected)
+
+            # the counts cover the queryset of the ModelAdmin only
+            restricted = ModelA.objects.filter(auto__lte=5)
+            with mock.patch.object(admin.site._registry[ModelA], 'get_queryset', return_value=restricted):
+                content = self.client.get(self.url).content.decode('utf-8')
+            for fq in persistents:
+                count = apply_filter_query(fq, restricted, ModelAFilter).count()
+                self.assertIn('>{} <small>({})</small></a>'.format(fq.name, count), content)
+
+        response = self.client.get(self.url)
+        self.assertNotIn('<small>(', response.content.decode('utf-8'))
+
+    def test_29_read_replicas(self):
+        fq = self.persistents.first()
+        request = mock.Mock(session=dict(), method='GET')
+        with AlterAppSettings(REPLICA='replica'):
+            self.assertEqual(get_read_database(request, ModelA), 'replica')
+            # the filtered queryset runs on the replica
+            custom_filter = mock.Mock(current_query=fq, filterset_class=ModelAFilter)
+            queryset = CustomFilter.queryset(custom_filter, request, ModelA.objects.all())
+            self.assertEqual(queryset.db, 'replica')
+            # overridden per filter query and per model
+            fq.database = 'other'
+            self.assertEqual(get_read_database(request, ModelA, fq), 'other')
+            with AlterAppSettings(REPLICAS={'testapp.modela': None}):
+                self.assertIsNone(get_read_database(request, ModelA))
+
+            # writes pin the session to the primary database
+            self.client.force_login(self.admin)
+            response = self.client.post(self.fq_url, data=dict(self.querydict, apply=True))
+            self.assertIn(PIN_SESSION_KEY, self.client.session)
+            request.session = self.client.session
+            self.assertIsNone(get_read_database(request, ModelA))
+            response = self.client.get(response.url)
+            self.assertEqual(response.status_code, 200)
+
+            # admin actions run on the default database
+            session = self.client.session
+            del session[PIN_SESSION_KEY]
+            session.save()
+            pks = list(apply_filter_query(fq, ModelA.objects.all(), ModelAFilter).values_list('pk', flat=True))
+            self.assertTrue(pks)
+            response = self.client.post('{}?filter_id={}'.format(self.url, fq.id), data={
+                'action': 'delete_selected', 'post': 'yes', '_selected_action': pks})
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(ModelA.objects.filter(pk__in=pks).exists())
+
+    def test_30_separate_database(self):
+        router = FilterQueryRouter()
+        with AlterAppSettings(DATABASE='filters'):
+            self.assertEqual(router.db_for_write(FilterQuery), 'filters')
+            self.assertEqual(router.db_for_read(FilterQuery), 'filters')
+            self.assertIsNone(router.db_for_read(ModelA))
+            self.assertTrue(router.allow_relation(FilterQuery(), self.admin))
+            self.assertTrue(router.allow_migrate('filters', 'django_admin_filter'))
+            self.assertFalse(router.allow_migrate('default', 'django_admin_filter'))
+            self.assertIsNone(router.allow_migrate('default', 'testapp'))
+            self.assertFalse(router.allow_migrate('filters', 'testapp'))
+            self.assertFalse(router.allow_migrate('filters', 'auth'))
+        self.assertIsNone(router.db_for_write(FilterQuery))
+
+        # filter queries live on a database of their own
+        routers = ['django_admin_filter.routers.FilterQueryRouter']
+        with override_settings(DATABASE_ROUTERS=routers), AlterAppSettings(DATABASE='filters'):
+            caches['default'].clear()
+            self.client.force_login(self.admin)
+            fq = FilterQuery.objects.create(
+                name='elsewhere', querydict=dict(auto__gt='1'), persistent=True, **self.fq_params)
+            self.assertTrue(FilterQuery.objects.using('filters').filter(pk=fq.pk).exists())
+            self.assertFalse(FilterQuery.objects.using('default').filter(name='elsewhere').exists())
+
+            # users and content-types are read from their own database
+            fq = FilterQuery.objects.get(pk=fq.pk)
+            self.assertEqual(fq.user, self.admin)
+            self.assertEqual(fq.content_type, self.fq_params['content_type'])
+
+            response = self.client.get('{}?filter_id={}'.format(self.url, fq.pk))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('elsewhere', response.content.decode('utf-8'))
+            response = self.client.get('{}{}/export/'.format(self.fq_url, fq.pk))
+            self.assertEqual(response.status_code, 200)
+            rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+            self.assertEqual(len(rows) - 1, ModelA.objects.filter(auto__gt=1).count())
+            response = self.client.get(reverse('admin:django_admin_filter_filterquery_changelist'))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('elsewhere', response.content.decode('utf-8'))
+
+            # the test database was migrated without ADMIN_FILTER_DATABASE and
+            # has constraints on the references to users and content-types
+            FilterQuery.objects.using('filters').all().delete()
+
+        # filter queries are exported without joining users or content-types
+        with CaptureQueriesContext(connection) as queries:
+            call_command('export_filterqueries', '--history', stdout=StringIO())
+        self.assertFalse([q for q in queries if 'JOIN' in q['sql']])
+
+        # the filter queries of deleted users are deleted by cascade
+        user = get_user_model().objects.create_user('someone')
+        fq = FilterQuery.objects.create(user=user, content_type=self.fq_params['content_type'])
+        user.delete()
+        self.assertFalse(FilterQuery.objects.filter(pk=fq.pk).exists())
+
+    def test_31_history_backends(self):
+        self.client.force_login(self.admin)
+        count = FilterQuery.objects.count()
+        for backend in ('session', 'cache'):
+            with AlterAppSettings(HISTORY_BACKEND=backend, HISTORY_LIMIT=2):
+                caches['default'].clear()
+                history = get_history_backend()
+                request = mock.Mock(user=self.admin, session=self.client.session)
+                response = self.client.post(self.fq_url, data=dict(auto__gt=1, apply=True))
+                pk = response.url.rsplit('=', 1)[1]
+                self.assertTrue(pk.startswith('h'))
+                response = self.client.get(response.url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(history.get(request, ModelA, pk).name, response.content.decode('utf-8'))
+
+                # identical entries are reused and the oldest ones are evicted
+                response = self.client.post(self.fq_url, data=dict(auto__gt=1, apply=True))
+                self.assertTrue(response.url.endswith(pk))
+                for value in (2, 3):
+                    self.client.post(self.fq_url, data=dict(auto__gt=value, apply=True))
+                request.session = self.client.session
+                entries = history.entries(request, ModelA)
+                self.assertEqual([e.querydict for e in entries], [dict(auto__gt='3'), dict(auto__gt='2')])
+                self.assertIsNone(history.get(request, ModelA, pk))
+
+                # a history entry saved as filter query leaves the history
+                url = '{}{}/'.format(self.fq_url, entries[0].id)
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.client.post(url, data=dict(auto__gt=3, save=True))
+                self.assertTrue(FilterQuery.objects.filter(querydict_hash=entries[0].querydict_hash, persistent=True).exists())
+                self.client.delete('{}{}/'.format(self.fq_url, entries[1].id))
+                request.session = self.client.session
+                self.assertEqual(history.entries(request, ModelA), [])
+
+        # only the saved filters touched the database
+        self.assertEqual(FilterQuery.objects.count(), count + 2)